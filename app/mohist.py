@@ -4,71 +4,241 @@
 モノタロウの購入履歴情報を収集して，Excel ファイルとして出力します．
 
 Usage:
-  mohist.py [-c CONFIG] [-e] [-N]
+  mohist.py [-c CONFIG] [-e] [-N] [-l LOG_DIR] [-L LIMIT] [-T TRACE] [-W REPORT] [-m METRICS] [-p PORT] [--profile PROFILE_DIR]
+          [--memory REPORT] [--memory-budget MB] [--memory-fail]
 
 Options:
   -c CONFIG     : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
   -e            : データ収集は行わず，Excel ファイルの出力のみ行います．
   -N            : サムネイル画像を含めないようにします．
+  -l LOG_DIR    : ログを LOG_DIR に書き出します．
+  -L LIMIT      : 商品毎のログのコンソールへの出力を，毎秒 LIMIT 行までに間引きます．
+  -T TRACE      : 処理のフェーズ毎の所要時間を TRACE に書き出します．
+  -W REPORT     : WebDriver のコマンドの回数と所要時間を REPORT に書き出します．
+  -m METRICS    : 処理速度などのメトリクスを終了時に METRICS に書き出します．
+  -p PORT       : メトリクスを Prometheus 形式で PORT に公開します．
+  --profile PROFILE_DIR : サンプリングプロファイラを有効にし，結果を PROFILE_DIR に書き出します．
+  --memory REPORT       : 処理の区切り毎のメモリ割り当て状況を REPORT に書き出します．
+  --memory-budget MB    : メモリ使用量の上限 (MB)．超えた場合は警告します．
+  --memory-fail         : メモリ使用量が上限を超えた場合にエラーとします．
+
+複数アカウントの場合，-T，-W，-m，--profile，--memory の出力と，-l のログは，
+アカウント (ログはワーカー) 毎にファイル名に名前を付けて分けて書き出します．-p は使えません．
 """
 
+import functools
 import logging
-import random
+import multiprocessing
+import pathlib
+import traceback
 
 import store_monotaro.handle
-import store_monotaro.crawler
 import store_monotaro.order_history
-import local_lib.selenium_util
+import local_lib.driver_telemetry
+import local_lib.logger
+import local_lib.memory_tracker
+import local_lib.metrics
+import local_lib.profiler
+import local_lib.tracer
 
 NAME = "mohist"
 VERSION = "0.1.0"
 
+STATUS_ACCOUNT = "[collect] Account"
+
+OPTION_DEFAULT = {
+    "log_dir": None,
+    "rate_limit": None,
+    "trace": None,
+    "telemetry": None,
+    "metrics": None,
+    "port": None,
+    "profile": None,
+    "memory": None,
+    "memory_budget": None,
+    "memory_fail": False,
+}
+
+
+def gen_account_path(path, name):
+    if path is None:
+        return None
+
+    path = pathlib.Path(path)
+
+    return str(path.with_name("{stem}_{name}{suffix}".format(stem=path.stem, name=name, suffix=path.suffix)))
+
+
+def init_instrument(option, name=None):
+    # NOTE: name を指定した場合は，アカウント毎にファイルを分ける．ポートは共有できないので公開しない
+    def get_path(key):
+        return option[key] if name is None else gen_account_path(option[key], name)
+
+    port = option["port"] if name is None else None
+
+    if option["trace"] is not None:
+        local_lib.tracer.init(get_path("trace"))
+    if option["telemetry"] is not None:
+        local_lib.driver_telemetry.init(get_path("telemetry"))
+    if (option["metrics"] is not None) or (port is not None):
+        local_lib.metrics.init("mohist", get_path("metrics"), port)
+    if option["profile"] is not None:
+        local_lib.profiler.init(get_path("profile"))
+    if option["memory"] is not None:
+        local_lib.memory_tracker.init(get_path("memory"), option["memory_budget"], option["memory_fail"])
+
+
+def finish_instrument():
+    local_lib.tracer.finish()
+    local_lib.driver_telemetry.finish()
+    local_lib.metrics.finish()
+    local_lib.profiler.finish()
+    local_lib.memory_tracker.finish()
+
 
 def execute_fetch(handle):
-    try:
-        store_monotaro.crawler.fetch_order_item_list(handle)
-    except:
-        driver, wait = store_monotaro.handle.get_selenium_driver(handle)
-        local_lib.selenium_util.dump_page(
-            driver, int(random.random() * 100), store_monotaro.handle.get_debug_dir_path(handle)
-        )
-        raise
+    # NOTE: Selenium などを読み込むので，データ収集を行う時のみ import する
+    import store_monotaro.crawler
 
+    # NOTE: エラー時の直近のページは fetch_order_item_list の中で書き出される
+    store_monotaro.crawler.fetch_order_item_list(handle)
 
-def execute(config, is_export_mode=False, is_need_thumb=True):
-    handle = store_monotaro.handle.create(config)
+
+def init_worker(option):
+    # NOTE: 同じファイルに複数のプロセスから書き込まないよう，ログはワーカー毎に分ける
+    local_lib.logger.init(
+        "mohist_{worker}".format(worker=multiprocessing.current_process().name),
+        level=logging.INFO,
+        log_dir_path=option["log_dir"],
+        is_queue=True,
+        rate_limit=option["rate_limit"],
+    )
+
+
+def fetch_account(account_config, option):
+    name = store_monotaro.handle.get_account_name(account_config["login"]["monotaro"])
+
+    init_instrument(option, name)
+    handle = store_monotaro.handle.create(account_config, is_progress=False)
+
+    try:
+        execute_fetch(handle)
+        return (name, None)
+    except:
+        logging.error(traceback.format_exc())
+        return (name, traceback.format_exc())
+    finally:
+        store_monotaro.handle.finish(handle)
+        finish_instrument()
+
+
+def execute_fetch_multi(handle, option):
+    config = handle["config"]
+    config_list = [
+        store_monotaro.handle.gen_account_config(config, account)
+        for account in store_monotaro.handle.get_account_list(config)
+    ]
+    concurrency = min(store_monotaro.handle.get_concurrency(config), len(config_list))
+
+    store_monotaro.handle.set_status(
+        handle,
+        "{count} アカウントの購入履歴を収集しています (並列数: {concurrency})...".format(
+            count=len(config_list), concurrency=concurrency
+        ),
+    )
+    store_monotaro.handle.set_progress_bar(handle, STATUS_ACCOUNT, len(config_list))
+
+    # NOTE: Windows と動作を揃えるため，常に spawn で新しいプロセスを起動する
+    error_list = []
+    with multiprocessing.get_context("spawn").Pool(
+        concurrency, initializer=init_worker, initargs=(option,)
+    ) as pool:
+        for name, error in pool.imap_unordered(functools.partial(fetch_account, option=option), config_list):
+            if error is not None:
+                logging.warning("Failed to fetch order of {name}".format(name=name))
+                error_list.append(name)
+            store_monotaro.handle.get_progress_bar(handle, STATUS_ACCOUNT).update()
+
+    store_monotaro.handle.merge_account_order_info(handle)
+
+    # NOTE: 一部のアカウントで失敗しても，収集できた分は Excel に出力する
+    if len(error_list) != 0:
+        logging.error("Failed to fetch order of {name}".format(name=", ".join(error_list)))
+
+
+def execute(config, is_export_mode=False, is_need_thumb=True, option=OPTION_DEFAULT):
+    with local_lib.profiler.phase("load"):
+        handle = store_monotaro.handle.create(config)
 
     try:
-        if not is_export_mode:
-            execute_fetch(handle)
-        store_monotaro.order_history.generate_table_excel(
-            handle, store_monotaro.handle.get_excel_file_path(handle), is_need_thumb
-        )
+        if store_monotaro.handle.is_multi_account(config):
+            if not is_export_mode:
+                with local_lib.profiler.phase("fetch"):
+                    execute_fetch_multi(handle, option)
+            else:
+                store_monotaro.handle.merge_account_order_info(handle)
+        elif not is_export_mode:
+            with local_lib.profiler.phase("fetch"):
+                execute_fetch(handle)
+        with local_lib.profiler.phase("excel"):
+            store_monotaro.order_history.generate_table_excel(
+                handle, store_monotaro.handle.get_excel_file_path(handle), is_need_thumb
+            )
 
         store_monotaro.handle.finish(handle)
     except:
         store_monotaro.handle.set_status(handle, "エラーが発生しました", is_error=True)
         logging.error(traceback.format_exc())
 
+    finish_instrument()
+
     input("完了しました．エンターを押すと終了します．")
 
+    local_lib.logger.finish()
+
 
 ######################################################################
 if __name__ == "__main__":
     from docopt import docopt
-    import traceback
 
-    import local_lib.logger
+    # NOTE: 実行ファイルにした場合に，ワーカープロセスを正しく起動するため
+    multiprocessing.freeze_support()
+
     import local_lib.config
 
     args = docopt(__doc__)
 
-    local_lib.logger.init("mohist", level=logging.INFO)
-
     config_file = args["-c"]
     is_export_mode = args["-e"]
     is_need_thumb = not args["-N"]
 
-    config = local_lib.config.load(args["-c"])
-
-    execute(config, is_export_mode, is_need_thumb)
+    option = {
+        "log_dir": args["-l"],
+        "rate_limit": None if args["-L"] is None else int(args["-L"]),
+        "trace": args["-T"],
+        "telemetry": args["-W"],
+        "metrics": args["-m"],
+        "port": None if args["-p"] is None else int(args["-p"]),
+        "profile": args["--profile"],
+        "memory": args["--memory"],
+        "memory_budget": None if args["--memory-budget"] is None else int(args["--memory-budget"]),
+        "memory_fail": args["--memory-fail"],
+    }
+
+    # NOTE: ログの整形や書き出しで巡回が止まらないよう，キュー経由で別スレッドから出力する
+    local_lib.logger.init(
+        "mohist",
+        level=logging.INFO,
+        log_dir_path=option["log_dir"],
+        is_queue=True,
+        rate_limit=option["rate_limit"],
+    )
+
+    config = local_lib.config.load(config_file)
+
+    if store_monotaro.handle.is_multi_account(config) and (option["port"] is not None):
+        raise Exception("複数アカウントの場合は -p を指定できません．")
+
+    init_instrument(option)
+
+    execute(config, is_export_mode, is_need_thumb, option)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+モノタロウの購入履歴情報を定期的に収集する，常駐型のサービスです．
+キャッシュとログイン済みの Web ブラウザを保持したまま差分収集を繰り返し，
+新しい注文や，商品情報・サムネイル画像の追加があった場合のみ Excel ファイルを出力し直します．
+
+Usage:
+  mohistd.py [-c CONFIG] [-i INTERVAL] [-N] [-l LOG_DIR] [-a PORT] [-1]
+
+Options:
+  -c CONFIG     : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
+  -i INTERVAL   : 収集を行う間隔 (分)．[default: 60]
+  -N            : サムネイル画像を含めないようにします．
+  -l LOG_DIR    : ログを LOG_DIR に書き出します．
+  -a PORT       : 購入履歴を参照する API を PORT に公開します．
+  -1            : 一回だけ収集して終了します．
+"""
+
+import logging
+import signal
+import threading
+import traceback
+
+import store_monotaro.api_server
+import store_monotaro.handle
+import store_monotaro.order_history
+import local_lib.logger
+
+import mohist
+
+
+def get_progress(handle, is_need_thumb):
+    # NOTE: 注文が増えなくても，商品情報やサムネイル画像が揃った場合は Excel に反映する
+    return {
+        "order": len(handle["order"]["order_no_stat"]),
+        "enrich": sum(1 for item in handle["order"]["item_list"] if "category" in item),
+        "thumb": store_monotaro.handle.get_thumb_count(handle) if is_need_thumb else 0,
+    }
+
+
+def execute_sync(handle, is_need_thumb):
+    prev_progress = get_progress(handle, is_need_thumb)
+
+    try:
+        mohist.execute_fetch(handle)
+    except KeyboardInterrupt:
+        raise
+    except:
+        logging.error(traceback.format_exc())
+        store_monotaro.handle.set_status(handle, "エラーが発生しました", is_error=True)
+
+        # NOTE: ブラウザの状態が不明なので，次回は起動し直す
+        try:
+            store_monotaro.handle.quit_selenium_driver(handle)
+        except:
+            logging.warning("Failed to quit browser")
+        return
+
+    progress = get_progress(handle, is_need_thumb)
+    excel_path = store_monotaro.handle.get_excel_file_path(handle)
+
+    if (progress == prev_progress) and excel_path.exists():
+        logging.info("No new order")
+        store_monotaro.handle.set_status(handle, "新しい注文はありません．")
+        return
+
+    logging.info(
+        "{order:,} new order(s), {enrich:,} new product detail(s), {thumb:,} new thumbnail(s)".format(
+            **{key: progress[key] - prev_progress[key] for key in progress}
+        )
+    )
+    store_monotaro.order_history.generate_table_excel(handle, excel_path, is_need_thumb)
+
+
+def execute(config, interval_min, is_need_thumb=True, is_once=False, api_port=None):
+    if store_monotaro.handle.is_multi_account(config):
+        raise Exception("常駐モードは複数アカウントに対応していません．")
+
+    handle = store_monotaro.handle.create(config)
+
+    # NOTE: 常駐しているハンドルをそのまま参照するので，キャッシュファイルの読み直しは不要
+    if api_port is not None:
+        store_monotaro.api_server.start(handle, api_port, is_reload=False)
+
+    stop_event = threading.Event()
+    state = {"is_syncing": False}
+
+    def stop(signum, frame):
+        logging.info("Receive signal {signum}, stopping...".format(signum=signum))
+        stop_event.set()
+        # NOTE: 収集の途中であれば，終わるのを待たずに中断する
+        if state["is_syncing"]:
+            raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        while not stop_event.is_set():
+            state["is_syncing"] = True
+            try:
+                execute_sync(handle, is_need_thumb)
+            finally:
+                state["is_syncing"] = False
+
+            if is_once:
+                break
+
+            logging.info("Next sync in {interval} min".format(interval=interval_min))
+            if stop_event.wait(interval_min * 60):
+                break
+    except KeyboardInterrupt:
+        logging.warning("Sync is interrupted")
+    finally:
+        store_monotaro.handle.finish(handle)
+
+
+######################################################################
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.config
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("mohistd", level=logging.INFO, log_dir_path=args["-l"], is_queue=True)
+
+    config = local_lib.config.load(args["-c"])
+
+    execute(
+        config,
+        float(args["-i"]),
+        not args["-N"],
+        args["-1"],
+        None if args["-a"] is None else int(args["-a"]),
+    )
+
+    local_lib.logger.finish()
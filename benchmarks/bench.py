@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成データを使って，キャッシュの保存・読み込み，データモデル，Excel 出力，
+ページ解析の処理時間とメモリ使用量を計測します．
+
+結果は JSON で出力されるので，コミット毎に実行して -b で比較できます．
+
+Usage:
+  bench.py [-n COUNT_LIST] [-r RATIO] [-d DEPTH] [-R REPEAT] [-t TARGET_LIST] [-w WORK_DIR] [-o OUTPUT]
+           [-b BASELINE]
+
+Options:
+  -n COUNT_LIST     : 商品数のリスト (カンマ区切り)．[default: 1000,10000]
+  -r RATIO          : リピート購入の割合．[default: 0.3]
+  -d DEPTH          : カテゴリの階層の深さ．[default: 3]
+  -R REPEAT         : 処理時間を計測する回数．[default: 3]
+  -t TARGET_LIST    : 計測対象のリスト (カンマ区切り)．
+                      [default: store,load,item_list,excel,excel_thumb,parse]
+  -w WORK_DIR       : 作業フォルダ．サムネイル画像はここに生成して再利用します．[default: data/bench]
+  -o OUTPUT         : 結果を書き出す JSON ファイル．[default: output/bench.json]
+  -b BASELINE       : 比較対象とする過去の結果 JSON ファイル．
+"""
+
+import datetime
+import gc
+import json
+import logging
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import synth
+
+import local_lib.serializer
+import store_monotaro.crawler
+import store_monotaro.handle
+import store_monotaro.order_history
+
+PARSE_LOOP = 10
+
+
+def gen_config(work_dir_path):
+    return {
+        "base_dir": pathlib.Path(work_dir_path).absolute(),
+        "login": {"monotaro": {"user": "bench", "pass": "bench"}},
+        "data": {
+            "selenium": "selenium",
+            "debug": "debug",
+            "monotaro": {"cache": {"order": "cache/mohist_cache.dat", "thumb": "thumb"}},
+        },
+        "output": {
+            "excel": {"font": {"name": "BIZ UDGothic", "size": 12}, "table": "output/mohist.xlsx"},
+        },
+    }
+
+
+def get_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        is_dirty = (
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True
+            ).stdout.strip()
+            != ""
+        )
+        return {"commit": commit, "dirty": is_dirty}
+    except:
+        return {"commit": None, "dirty": None}
+
+
+def measure(func, repeat):
+    time_list = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        time_list.append(time.perf_counter() - start)
+
+    # NOTE: tracemalloc は処理を遅くするので，処理時間とは別に計測する
+    gc.collect()
+    tracemalloc.start()
+    func()
+    memory_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "time": {"min": min(time_list), "median": statistics.median(time_list)},
+        "memory_peak": memory_peak,
+    }
+
+
+def gen_parse_text_list(item_list):
+    return [
+        {
+            "datetime": item["date"].strftime("%Y/%m/%d %H:%M:%S"),
+            "month": item["date"].strftime("%Y-%m"),
+            "price": "{price:,}円".format(price=item["price"]),
+            "tax": "{tax}%".format(tax=int(item["tax"] * 100)),
+            "no": "注文書番号：{no}".format(no=item["no"]),
+        }
+        for item in item_list
+    ]
+
+
+def bench_parse(text_list):
+    for _ in range(PARSE_LOOP):
+        for text in text_list:
+            store_monotaro.crawler.parse_datetime(text["datetime"])
+            store_monotaro.crawler.parse_month(text["month"])
+            store_monotaro.crawler.parse_price(text["price"])
+            store_monotaro.crawler.parse_tax(text["tax"])
+            store_monotaro.crawler.parse_order_no(text["no"])
+
+
+def execute_bench(handle, item_count, target_list, option):
+    item_list = synth.gen_item_list(item_count, option["repeat_ratio"], option["category_depth"])
+    handle["order"] = synth.gen_order_info(item_list)
+
+    cache_path = store_monotaro.handle.get_caceh_file_path(handle)
+    excel_path = store_monotaro.handle.get_excel_file_path(handle)
+
+    if "excel_thumb" in target_list:
+        logging.info("Generate thumbnails...")
+        synth.gen_thumb_all(store_monotaro.handle.get_thumb_dir_path(handle), item_list)
+
+    bench_def = {
+        "store": lambda: local_lib.serializer.store(cache_path, handle["order"]),
+        "load": lambda: local_lib.serializer.load(cache_path, {}),
+        "item_list": lambda: store_monotaro.handle.get_item_list(handle),
+        "excel": lambda: store_monotaro.order_history.generate_table_excel(handle, excel_path, False),
+        "excel_thumb": lambda: store_monotaro.order_history.generate_table_excel(handle, excel_path, True),
+    }
+
+    if "parse" in target_list:
+        text_list = gen_parse_text_list(item_list)
+        bench_def["parse"] = lambda: bench_parse(text_list)
+
+    if ("load" in target_list) and (not cache_path.exists()):
+        bench_def["store"]()
+
+    result = {}
+    for target in target_list:
+        logging.info("Measure {target} ({count:,} items)".format(target=target, count=item_count))
+        result[target] = measure(bench_def[target], option["repeat"])
+        logging.info(
+            "{target}: {time:.3f} sec, {memory:,.1f} MB".format(
+                target=target,
+                time=result[target]["time"]["median"],
+                memory=result[target]["memory_peak"] / (1024 * 1024),
+            )
+        )
+
+    return result
+
+
+def compare(result, baseline):
+    logging.info(
+        "Compare with {commit}".format(commit=baseline["env"]["commit"] if "env" in baseline else "baseline")
+    )
+
+    for count, target_result in result["result"].items():
+        if count not in baseline["result"]:
+            continue
+        for target, value in target_result.items():
+            if target not in baseline["result"][count]:
+                continue
+            base_value = baseline["result"][count][target]
+            logging.info(
+                "{count:>7s} {target:12s} time: {time_ratio:6.1%}  memory: {memory_ratio:6.1%}".format(
+                    count=count,
+                    target=target,
+                    time_ratio=value["time"]["median"] / base_value["time"]["median"],
+                    memory_ratio=value["memory_peak"] / max(base_value["memory_peak"], 1),
+                )
+            )
+
+
+def execute(config, count_list, target_list, option):
+    handle = store_monotaro.handle.create(config)
+
+    result = {
+        "env": {
+            **get_commit(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(),
+        },
+        "param": {**option, "target": target_list},
+        "result": {},
+    }
+
+    for count in count_list:
+        result["result"][str(count)] = execute_bench(handle, count, target_list, option)
+
+    store_monotaro.handle.finish(handle)
+
+    return result
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("bench", level=logging.INFO)
+
+    count_list = [int(count) for count in args["-n"].split(",")]
+    target_list = [target.strip() for target in args["-t"].split(",")]
+    option = {
+        "repeat_ratio": float(args["-r"]),
+        "category_depth": int(args["-d"]),
+        "repeat": int(args["-R"]),
+    }
+
+    result = execute(gen_config(args["-w"]), count_list, target_list, option)
+
+    output_path = pathlib.Path(args["-o"])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    logging.info("Write result to {path}".format(path=output_path))
+
+    if args["-b"] is not None:
+        with open(args["-b"], "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
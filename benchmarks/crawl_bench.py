@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代替サイトに対してクローラを動かし，購入履歴の収集全体の処理時間を計測します．
+ネットワーク接続は不要ですが，Google Chrome が必要です．
+
+Usage:
+  crawl_bench.py [-n COUNT] [-r RATIO] [-l LATENCY] [-e ERROR_RATE] [-w WORK_DIR] [-o OUTPUT] [-k]
+
+Options:
+  -n COUNT      : 生成する商品の数．[default: 100]
+  -r RATIO      : リピート購入の割合．[default: 0.3]
+  -l LATENCY    : 各レスポンスに加える遅延 (秒)．[default: 0]
+  -e ERROR_RATE : エラー応答を返す割合．[default: 0]
+  -w WORK_DIR   : 作業フォルダ．[default: data/crawl_bench]
+  -o OUTPUT     : 結果を書き出す JSON ファイル．[default: output/crawl_bench.json]
+  -k            : 前回のキャッシュを残したまま実行します (差分収集の計測)．
+"""
+
+import datetime
+import json
+import logging
+import pathlib
+import socket
+import time
+
+import bench
+import monotaro_site
+import synth
+
+import store_monotaro.const
+import store_monotaro.crawler
+import store_monotaro.handle
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+
+def execute(config, item_count, repeat_ratio, latency, error_rate, is_keep_cache):
+    port = get_free_port()
+    server, site = monotaro_site.start(
+        port, synth.gen_item_list(item_count, repeat_ratio), latency, error_rate
+    )
+
+    store_monotaro.const.BASE_URL = "http://localhost:{port}".format(port=port)
+
+    cache_path = pathlib.Path(config["base_dir"], config["data"]["monotaro"]["cache"]["order"])
+    if not is_keep_cache:
+        cache_path.unlink(missing_ok=True)
+
+    handle = store_monotaro.handle.create(config)
+
+    start = time.perf_counter()
+    error = None
+    try:
+        store_monotaro.crawler.fetch_order_item_list(handle)
+    except Exception as e:
+        error = str(e)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "env": {**bench.get_commit(), "date": datetime.datetime.now().isoformat()},
+        "param": {
+            "count": item_count,
+            "repeat_ratio": repeat_ratio,
+            "latency": latency,
+            "error_rate": error_rate,
+            "keep_cache": is_keep_cache,
+        },
+        "result": {
+            "time": elapsed,
+            "error": error,
+            "item": len(handle["order"]["item_list"]),
+            "order": len(handle["order"]["order_no_stat"]),
+            "request": site.stat,
+        },
+    }
+
+    store_monotaro.handle.finish(handle)
+    server.shutdown()
+
+    return result
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("bench", level=logging.INFO)
+
+    result = execute(
+        bench.gen_config(args["-w"]),
+        int(args["-n"]),
+        float(args["-r"]),
+        float(args["-l"]),
+        float(args["-e"]),
+        args["-k"],
+    )
+
+    logging.info(
+        "{item:,} items in {time:.1f} sec ({stat})".format(
+            item=result["result"]["item"], time=result["result"]["time"], stat=result["result"]["request"]
+        )
+    )
+
+    output_path = pathlib.Path(args["-o"])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
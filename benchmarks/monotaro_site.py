@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+オフラインでクローラを動かすための，モノタロウの代替サイトです．
+合成データから，クローラが参照する XPath に合わせたページを生成して返します．
+
+クローラ側は環境変数 MOHIST_MONOTARO_URL にこのサーバの URL を指定して実行します．
+
+Usage:
+  monotaro_site.py [-p PORT] [-n COUNT] [-r RATIO] [-d DEPTH] [-s SEED] [-l LATENCY] [-e ERROR_RATE]
+
+Options:
+  -p PORT       : 待ち受けるポート．[default: 18080]
+  -n COUNT      : 生成する商品の数．[default: 1000]
+  -r RATIO      : リピート購入の割合．[default: 0.3]
+  -d DEPTH      : カテゴリの階層の深さ．[default: 3]
+  -s SEED       : 乱数のシード．[default: 0]
+  -l LATENCY    : 各レスポンスに加える遅延 (秒)．[default: 0]
+  -e ERROR_RATE : エラー応答を返す割合．[default: 0]
+"""
+
+import html
+import http.cookies
+import http.server
+import io
+import logging
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+import synth
+
+SESSION_COOKIE = "mohist_session"
+LINK_MONTH_COUNT = 6
+ORDER_CANCEL_RATIO = 0.02
+ITEM_CANCEL_RATIO = 0.03
+LATENCY_JITTER = 0.2
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+<div id="globalMenu">モノタロウ</div>
+{body}
+</body>
+</html>
+"""
+
+LOGIN_TEMPLATE = """<h1 class="LoginTitle">ログイン</h1>
+<form method="post" action="/login?next={next}">
+<input type="text" name="userId">
+<input type="password" name="password">
+<button type="submit" class="Button">ログイン</button>
+</form>
+"""
+
+
+class MonotaroSite:
+    def __init__(self, item_list, latency=0, error_rate=0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rand = random.Random(seed)
+        self.lock = threading.Lock()
+        self.thumb_cache = {}
+        self.stat = {"page": 0, "thumb": 0, "login": 0, "error": 0}
+
+        self.order_map = {}
+        for item in item_list:
+            if item["link_no"] not in self.order_map:
+                self.order_map[item["link_no"]] = {
+                    "date": item["date"],
+                    "no": item["no"],
+                    "link_no": item["link_no"],
+                    "is_cancel": self.rand.random() < ORDER_CANCEL_RATIO,
+                    "item_list": [],
+                }
+            self.order_map[item["link_no"]]["item_list"].append(
+                item | {"is_cancel": self.rand.random() < ITEM_CANCEL_RATIO}
+            )
+
+        self.month_map = {}
+        for order in self.order_map.values():
+            self.month_map.setdefault(order["date"].strftime("%Y-%m"), []).append(order)
+
+        self.product_map = {item["id"]: item for item in item_list}
+
+    def inject_fault(self):
+        if self.latency != 0:
+            time.sleep(self.latency * (1 + LATENCY_JITTER * (self.rand.random() * 2 - 1)))
+
+        with self.lock:
+            if self.rand.random() < self.error_rate:
+                self.stat["error"] += 1
+                return True
+        return False
+
+    def count(self, kind):
+        with self.lock:
+            self.stat[kind] += 1
+
+    def gen_month_index_page(self):
+        month_list = sorted(self.month_map.keys(), reverse=True)
+
+        link = "".join(
+            '<a href="/monotaroMain.py?func=monotaro.orderHistory.showListServlet.ShowListServlet'
+            + '&targetMonth={month}">{month}</a>'.format(month=month)
+            for month in month_list[:LINK_MONTH_COUNT]
+        )
+        option = "".join(
+            '<option value="{month}">{month}</option>'.format(month=month)
+            for month in month_list[LINK_MONTH_COUNT:]
+        )
+
+        return (
+            '<div class="oder_date">{link}</div>'.format(link=link)
+            + '<select name="targetMonthCmb"><option value="">選択</option>'
+            + "{option}</select>".format(option=option)
+        )
+
+    def gen_order_box(self, order):
+        total_price = sum(item["price"] for item in order["item_list"] if not item["is_cancel"])
+
+        if order["is_cancel"]:
+            button = '<span class="OrderStatus">キャンセル済み</span>'
+        else:
+            button = (
+                '<span class="OrderStatus">出荷済み</span>'
+                + '<a class="Button" href="{url}" data-ee-recv-order-no="{link_no}">注文詳細</a>'.format(
+                    url=html.escape(gen_detail_path(order["link_no"])), link_no=order["link_no"]
+                )
+            )
+
+        return (
+            '<div class="orderHistory_list_box">'
+            + '<p class="detail_guide">ご注文日時：<strong>{date}</strong> '.format(
+                date=order["date"].strftime("%Y/%m/%d %H:%M:%S")
+            )
+            + '合計：<span class="price">{price:,}円</span></p>'.format(price=total_price)
+            + '<div class="DeteilItem"><span class="DeteilItem__Label">注文番号</span>'
+            + '<span class="DeteilItem__Text">{no}</span></div>'.format(no=order["no"])
+            + '<div class="OrderStatusArea">{button}</div>'.format(button=button)
+            + "</div>"
+        )
+
+    def gen_month_page(self, month):
+        return "".join(self.gen_order_box(order) for order in self.month_map.get(month, []))
+
+    def gen_item_row(self, item):
+        if item["is_cancel"]:
+            status = '<strong class="cancel">キャンセル</strong>'
+        else:
+            status = "出荷済み"
+
+        return (
+            "<tr>"
+            + '<td><table class="orderHistory_item"><tbody><tr>'
+            + '<td><a href="{url}" data-analytics-tag="{id},{name}">{name}</a></td>'.format(
+                url=gen_product_path(item["id"]), id=item["id"], name=html.escape(item["name"])
+            )
+            + '<td class="productimage"><img src="{thumb}"></td>'.format(thumb=gen_thumb_path(item["id"]))
+            + "</tr></tbody></table></td>"
+            + "<td>{status}</td>".format(status=status)
+            + "<td>{count}</td>".format(count=item["count"])
+            + "<td>{price:,}円</td>".format(price=round(item["price"] / (1 + item["tax"])))
+            + "<td>{tax}%</td>".format(tax=round(item["tax"] * 100))
+            + "</tr>"
+        )
+
+    def gen_detail_page(self, link_no):
+        order = self.order_map[link_no]
+
+        return (
+            '<div id="oderHistoryDetail">'
+            + '<p class="detail_guide">ご注文日時：<strong>{date}</strong><br>'.format(
+                date=order["date"].strftime("%Y/%m/%d %H:%M:%S")
+            )
+            + "お支払い方法：請求書払い<br>"
+            + "注文書番号：{no}</p>".format(no=order["no"])
+            + '<table class="oderHistory_product" data-ee-list-name="orderhistory_datail"><tbody>'
+            + "<tr><th>商品名</th><th>注文状況</th><th>数量</th><th>金額(税抜)</th><th>消費税</th></tr>"
+            + "".join(self.gen_item_row(item) for item in order["item_list"])
+            + "</tbody></table></div>"
+        )
+
+    def gen_product_page(self, product_id):
+        product = self.product_map[product_id]
+
+        return (
+            '<ul class="BreadCrumbs"><li>ホーム</li>'
+            + "".join("<li>{name}</li>".format(name=html.escape(name)) for name in product["category"])
+            + "</ul>"
+            + '<h1 class="ProductName">{name}</h1>'.format(name=html.escape(product["name"]))
+            + '<img src="{thumb}">'.format(thumb=gen_thumb_path(product_id))
+        )
+
+    def get_thumb(self, product_id):
+        with self.lock:
+            if product_id not in self.thumb_cache:
+                buf = io.BytesIO()
+                synth.gen_thumb(buf, int(product_id))
+                self.thumb_cache[product_id] = buf.getvalue()
+            return self.thumb_cache[product_id]
+
+
+def gen_detail_path(link_no):
+    return (
+        "/monotaroMain.py?func=monotaro.orderHistory.showReadServlet.ShowReadServlet"
+        + "&recvOrderNo={link_no}".format(link_no=link_no)
+    )
+
+
+def gen_product_path(product_id):
+    return "/p/{id_head}/{id_tail}/".format(id_head=product_id[:4], id_tail=product_id[4:])
+
+
+def gen_thumb_path(product_id):
+    return "/thumb/{id}.png".format(id=product_id)
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    site = None
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def send_body(self, body, content_type="text/html; charset=utf-8", status=200):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_page(self, title, body):
+        self.send_body(PAGE_TEMPLATE.format(title=title, body=body))
+
+    def is_logged_in(self):
+        cookie = http.cookies.SimpleCookie(self.headers.get("Cookie", ""))
+        return SESSION_COOKIE in cookie
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/login":
+            return self.send_error(404)
+
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        self.site.count("login")
+
+        self.send_response(302)
+        self.send_header("Set-Cookie", "{name}=1; Path=/".format(name=SESSION_COOKIE))
+        self.send_header("Location", urllib.parse.parse_qs(url.query).get("next", ["/"])[0])
+        self.end_headers()
+
+    def do_GET(self):
+        if self.site.inject_fault():
+            return self.send_error(500)
+
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path.startswith("/thumb/"):
+            self.site.count("thumb")
+            return self.send_body(self.site.get_thumb(url.path[len("/thumb/") : -len(".png")]), "image/png")
+
+        self.site.count("page")
+
+        product = re.match(r"/p/(\d{4})/(\d+)/", url.path)
+        if product is not None:
+            product_id = product.group(1) + product.group(2)
+            if product_id not in self.site.product_map:
+                return self.send_error(404)
+            return self.send_page("商品", self.site.gen_product_page(product_id))
+
+        if url.path == "/":
+            return self.send_page("トップ", "")
+        elif url.path != "/monotaroMain.py":
+            return self.send_error(404)
+
+        if not self.is_logged_in():
+            return self.send_page("ログイン", LOGIN_TEMPLATE.format(next=urllib.parse.quote(self.path)))
+
+        func = query.get("func", [""])[0]
+        if func.endswith("ShowReadServlet"):
+            link_no = query.get("recvOrderNo", [""])[0]
+            if link_no not in self.site.order_map:
+                return self.send_error(404)
+            return self.send_page("注文詳細", self.site.gen_detail_page(link_no))
+        elif "targetMonth" in query:
+            year, month = query["targetMonth"][0].split("-")
+            return self.send_page(
+                "注文履歴",
+                self.site.gen_month_page("{year}-{month:02d}".format(year=year, month=int(month))),
+            )
+        else:
+            return self.send_page("注文履歴", self.site.gen_month_index_page())
+
+
+def create_server(port, item_list, latency=0, error_rate=0, seed=0):
+    site = MonotaroSite(item_list, latency, error_rate, seed)
+    handler = type("MonotaroRequestHandler", (RequestHandler,), {"site": site})
+
+    server = http.server.ThreadingHTTPServer(("", port), handler)
+    server.daemon_threads = True
+
+    return (server, site)
+
+
+def start(port, item_list, latency=0, error_rate=0, seed=0):
+    server, site = create_server(port, item_list, latency, error_rate, seed)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return (server, site)
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("monotaro_site", level=logging.INFO)
+
+    seed = int(args["-s"])
+    item_list = synth.gen_item_list(int(args["-n"]), float(args["-r"]), int(args["-d"]), seed)
+
+    server, site = create_server(int(args["-p"]), item_list, float(args["-l"]), float(args["-e"]), seed)
+
+    logging.info(
+        "Serve {order:,} orders on http://localhost:{port}/".format(
+            order=len(site.order_map), port=args["-p"]
+        )
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    logging.info("Stat: {stat}".format(stat=site.stat))
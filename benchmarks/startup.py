@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Excel の出力のみ (-e) の場合に読み込まれるモジュールの import 時間を計測します．
+Selenium などデータ収集用のモジュールが読み込まれた場合や，基準の結果と比べて
+import 時間が許容範囲を超えて増えた場合は，終了コード 1 で終了します．
+
+Usage:
+  startup.py [-R REPEAT] [-o OUTPUT] [-b BASELINE] [-t TOLERANCE]
+
+Options:
+  -R REPEAT         : 計測する回数．[default: 10]
+  -o OUTPUT         : 結果を書き出す JSON ファイル．[default: output/startup.json]
+  -b BASELINE       : 比較対象とする過去の結果 JSON ファイル．
+  -t TOLERANCE      : 基準の結果に対して許容する増加の割合．[default: 0.2]
+"""
+
+import datetime
+import json
+import logging
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+
+import bench
+
+BASE_DIR_PATH = pathlib.Path(__file__).parent.parent
+
+# NOTE: -e で実行する時には読み込まれてはいけないモジュール
+FORBIDDEN_MODULE_LIST = [
+    "selenium",
+    "pydub",
+    "speech_recognition",
+    "store_monotaro.crawler",
+    "local_lib.captcha",
+    "local_lib.selenium_util",
+    "local_lib.notify_mail",
+]
+
+MEASURE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import mohist
+elapsed = time.perf_counter() - start
+print(json.dumps({"time": elapsed, "module": list(sys.modules.keys())}))
+"""
+
+
+def measure_once():
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(BASE_DIR_PATH / "lib"), str(BASE_DIR_PATH / "app")]
+        + ([env["PYTHONPATH"]] if "PYTHONPATH" in env else [])
+    )
+
+    proc = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT], capture_output=True, text=True, check=True, env=env
+    )
+
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def get_forbidden_module(module_list):
+    return sorted(
+        {
+            name
+            for name in FORBIDDEN_MODULE_LIST
+            for module in module_list
+            if (module == name) or module.startswith(name + ".")
+        }
+    )
+
+
+def execute(repeat):
+    time_list = []
+    forbidden_list = []
+    for _ in range(repeat):
+        measured = measure_once()
+        time_list.append(measured["time"])
+        forbidden_list = get_forbidden_module(measured["module"])
+
+    return {
+        "env": {
+            **bench.get_commit(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(),
+        },
+        "param": {"repeat": repeat},
+        "result": {
+            "time": {
+                "median": statistics.median(time_list),
+                "min": min(time_list),
+                "max": max(time_list),
+            },
+            "forbidden_module": forbidden_list,
+        },
+    }
+
+
+def check(result, baseline, tolerance):
+    is_ok = True
+
+    if len(result["result"]["forbidden_module"]) != 0:
+        logging.error(
+            "Modules for crawling are loaded: {module}".format(
+                module=", ".join(result["result"]["forbidden_module"])
+            )
+        )
+        is_ok = False
+
+    if baseline is not None:
+        # NOTE: 起動時間はばらつきが大きいので，最小値で比較する
+        ratio = result["result"]["time"]["min"] / baseline["result"]["time"]["min"]
+        logging.info(
+            "Compare with {commit}: {ratio:6.1%}".format(commit=baseline["env"]["commit"], ratio=ratio)
+        )
+        if ratio > 1 + tolerance:
+            logging.error("Import time regressed by more than {tolerance:.0%}".format(tolerance=tolerance))
+            is_ok = False
+
+    return is_ok
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("bench", level=logging.INFO)
+
+    result = execute(int(args["-R"]))
+
+    logging.info(
+        "Import time: {median:.3f} sec (min {min:.3f}, max {max:.3f})".format(**result["result"]["time"])
+    )
+
+    output_path = pathlib.Path(args["-o"])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    logging.info("Write result to {path}".format(path=output_path))
+
+    baseline = None
+    if args["-b"] is not None:
+        with open(args["-b"], "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    sys.exit(0 if check(result, baseline, float(args["-t"])) else 1)
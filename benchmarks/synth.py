@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ベンチマーク用に，モノタロウの購入履歴を模した合成データを生成します．
+
+Usage:
+  synth.py [-n COUNT] [-r RATIO] [-d DEPTH] [-s SEED] [-t THUMB_DIR]
+
+Options:
+  -n COUNT      : 生成する商品の数．[default: 1000]
+  -r RATIO      : リピート購入の割合．[default: 0.3]
+  -d DEPTH      : カテゴリの階層の深さ．[default: 3]
+  -s SEED       : 乱数のシード．[default: 0]
+  -t THUMB_DIR  : サムネイル画像を生成するフォルダ．
+"""
+
+import datetime
+import logging
+import pathlib
+import random
+
+import PIL.Image
+import PIL.ImageDraw
+
+PRODUCT_URL = "https://www.monotaro.com/p/{id_head}/{id_tail}/"
+
+NAME_WORD_LIST = [
+    "ステンレス",
+    "六角ボルト",
+    "ナット",
+    "結束バンド",
+    "養生テープ",
+    "軍手",
+    "作業用手袋",
+    "電工ドラム",
+    "LED投光器",
+    "保護メガネ",
+    "防塵マスク",
+    "収納ボックス",
+    "キャスター",
+    "ドライバー",
+    "モンキーレンチ",
+    "潤滑スプレー",
+]
+CATEGORY_FANOUT = 6
+ITEM_PER_ORDER_MAX = 5
+TAX_RATE = 0.1
+THUMB_SIZE = (120, 120)
+
+
+def gen_category_tree(depth):
+    return [
+        ["カテゴリ{level}-{index}".format(level=level + 1, index=i) for i in range(CATEGORY_FANOUT)]
+        for level in range(depth)
+    ]
+
+
+def gen_product(rand, index, category_tree):
+    product_id = "{id:08d}".format(id=10000000 + index * 7)
+    depth = rand.randint(1, len(category_tree))
+
+    return {
+        "id": product_id,
+        "name": " ".join(rand.sample(NAME_WORD_LIST, 3)) + " {size}mm".format(size=rand.randint(1, 500)),
+        "url": PRODUCT_URL.format(id_head=product_id[:4], id_tail=product_id[4:]),
+        "category": [rand.choice(category_tree[level]) for level in range(depth)],
+        "unit_price": rand.randint(50, 30000),
+    }
+
+
+def gen_product_list(item_count, repeat_ratio=0.3, category_depth=3, seed=0):
+    rand = random.Random(seed)
+    category_tree = gen_category_tree(category_depth)
+
+    product_count = max(1, round(item_count * (1 - repeat_ratio)))
+
+    return [gen_product(rand, i, category_tree) for i in range(product_count)]
+
+
+def gen_item_list(item_count, repeat_ratio=0.3, category_depth=3, seed=0):
+    rand = random.Random(seed)
+    product_list = gen_product_list(item_count, repeat_ratio, category_depth, seed)
+
+    # NOTE: 一通り購入した後，残りをリピート購入として混ぜる
+    purchase_list = product_list + [rand.choice(product_list) for _ in range(item_count - len(product_list))]
+    rand.shuffle(purchase_list)
+
+    date = datetime.datetime(2015, 1, 5, 9, 0, 0)
+    order_no = 100000000
+
+    item_list = []
+    i = 0
+    while i < item_count:
+        date += datetime.timedelta(hours=rand.randint(1, 24 * 3), seconds=rand.randint(0, 3599))
+        order_no += rand.randint(1, 50)
+
+        for product in purchase_list[i : i + rand.randint(1, ITEM_PER_ORDER_MAX)]:
+            count = rand.randint(1, 10)
+            item_list.append(
+                {
+                    "name": product["name"],
+                    "count": count,
+                    "price": round(product["unit_price"] * count * (1 + TAX_RATE)),
+                    "tax": TAX_RATE,
+                    "url": product["url"],
+                    "id": product["id"],
+                    "category": list(product["category"]),
+                    "date": date,
+                    "no": str(order_no),
+                    "link_no": str(order_no * 10 + 1),
+                }
+            )
+            i += 1
+
+    return item_list
+
+
+def gen_order_info(item_list):
+    month_list = sorted({item["date"].replace(day=1, hour=0, minute=0, second=0) for item in item_list})
+
+    month_count = {}
+    order_no_stat = {}
+    for item in item_list:
+        if item["no"] not in order_no_stat:
+            month = item["date"].strftime("%Y-%m")
+            month_count[month] = month_count.get(month, 0) + 1
+        order_no_stat[item["no"]] = True
+
+    return {
+        "month_list": month_list,
+        "month_count": month_count,
+        "month_stat": {month: True for month in month_count.keys()},
+        "item_list": item_list,
+        "order_no_stat": order_no_stat,
+        "last_modified": item_list[-1]["date"] if len(item_list) != 0 else datetime.datetime(1994, 7, 5),
+    }
+
+
+def gen_thumb(thumb_path, seed):
+    rand = random.Random(seed)
+
+    img = PIL.Image.new("RGB", THUMB_SIZE, (255, 255, 255))
+    draw = PIL.ImageDraw.Draw(img)
+    for _ in range(8):
+        x, y = rand.randint(0, THUMB_SIZE[0] - 20), rand.randint(0, THUMB_SIZE[1] - 20)
+        draw.rectangle(
+            (x, y, x + rand.randint(10, 60), y + rand.randint(10, 60)),
+            fill=(rand.randint(0, 255), rand.randint(0, 255), rand.randint(0, 255)),
+        )
+    img.save(thumb_path, format="PNG")
+
+
+def gen_thumb_all(thumb_dir_path, item_list):
+    thumb_dir_path = pathlib.Path(thumb_dir_path)
+    thumb_dir_path.mkdir(parents=True, exist_ok=True)
+
+    for product_id in sorted({item["id"] for item in item_list}):
+        thumb_path = thumb_dir_path / (product_id + ".png")
+        if not thumb_path.exists():
+            gen_thumb(thumb_path, int(product_id))
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    item_list = gen_item_list(int(args["-n"]), float(args["-r"]), int(args["-d"]), int(args["-s"]))
+    order_info = gen_order_info(item_list)
+
+    logging.info(
+        "{item:,} items, {order:,} orders, {product:,} products, {month:,} months".format(
+            item=len(item_list),
+            order=len(order_info["order_no_stat"]),
+            product=len({item["id"] for item in item_list}),
+            month=len(order_info["month_list"]),
+        )
+    )
+
+    if args["-t"] is not None:
+        gen_thumb_all(args["-t"], item_list)
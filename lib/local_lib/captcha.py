@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+"""
+reCAPTCHA を解決します．
 
+Usage:
+  captcha.py -f AUDIO [-e ENGINE]
+
+Options:
+  -f AUDIO      : 認識させる音声ファイル (MP3)．
+  -e ENGINE     : 音声認識エンジン (google, sphinx, whisper)．[default: google]
+"""
+
+import io
 import os
 import pathlib
-import tempfile
 import time
-import urllib
+import urllib.request
 
 import logging
 import pydub
@@ -16,6 +26,7 @@ from speech_recognition import AudioFile, Recognizer
 
 import local_lib.selenium_util
 import local_lib.notify_mail
+import local_lib.captcha_handoff
 
 
 DATA_PATH = pathlib.Path(os.path.dirname(__file__)).parent / "data"
@@ -26,29 +37,48 @@ RECORD_PATH = str(DATA_PATH / "record")
 DUMP_PATH = str(DATA_PATH / "debug")
 
 
-def recog_audio(audio_url):
-    mp3_file = tempfile.NamedTemporaryFile(mode="wb", delete=False)
-    wav_file = tempfile.NamedTemporaryFile(mode="wb", delete=False)
+# NOTE: 音声認識は 16kHz モノラルで十分なので，変換時にリサンプリングしてデータ量を減らす
+SAMPLE_RATE = 16000
+
+# NOTE: 音声認識エンジン．sphinx (pocketsphinx) と whisper (openai-whisper) はオフラインで動作する
+RECOGNIZER = {
+    "google": lambda recognizer, audio: recognizer.recognize_google(audio, language="en-US"),
+    "sphinx": lambda recognizer, audio: recognizer.recognize_sphinx(audio, language="en-US"),
+    "whisper": lambda recognizer, audio: recognizer.recognize_whisper(
+        audio, model="base.en", language="english"
+    ),
+}
+
+
+def download_audio(audio_url):
+    with urllib.request.urlopen(audio_url) as res:
+        return res.read()
+
 
-    try:
-        urllib.request.urlretrieve(audio_url, mp3_file.name)
+def convert_audio(mp3_data):
+    wav_buf = io.BytesIO()
 
-        pydub.AudioSegment.from_mp3(mp3_file.name).export(wav_file.name, format="wav")
+    pydub.AudioSegment.from_file(io.BytesIO(mp3_data), format="mp3").set_channels(1).set_frame_rate(
+        SAMPLE_RATE
+    ).export(wav_buf, format="wav")
+    wav_buf.seek(0)
 
-        recognizer = Recognizer()
-        recaptcha_audio = AudioFile(wav_file.name)
-        with recaptcha_audio as source:
-            audio = recognizer.record(source)
+    return wav_buf
 
-        return recognizer.recognize_google(audio, language="en-US")
-    except:
-        raise
-    finally:
-        os.unlink(mp3_file.name)
-        os.unlink(wav_file.name)
 
+def recog_audio_data(mp3_data, engine="google"):
+    recognizer = Recognizer()
+    with AudioFile(convert_audio(mp3_data)) as source:
+        audio = recognizer.record(source)
 
-def resolve_mp3(driver, wait):
+    return RECOGNIZER[engine](recognizer, audio)
+
+
+def recog_audio(audio_url, engine="google"):
+    return recog_audio_data(download_audio(audio_url), engine)
+
+
+def resolve_mp3(driver, wait, engine="google"):
     wait.until(
         EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//iframe[contains(@title,"reCAPTCHA")]'))
     )
@@ -76,7 +106,7 @@ def resolve_mp3(driver, wait):
 
     audio_url = driver.find_element(By.XPATH, '//audio[@id="audio-source"]').get_attribute("src")
 
-    text = recog_audio(audio_url)
+    text = recog_audio(audio_url, engine)
 
     input_elem = driver.find_element(By.XPATH, '//input[@id="audio-response"]')
     input_elem.send_keys(text.lower())
@@ -87,7 +117,11 @@ def resolve_mp3(driver, wait):
     return True
 
 
-def resolve_img_console(driver, wait, captcha_img_path):
+def resolve_img(driver, wait, ask_func):
+    # NOTE: ask_func には問題画像 (PNG) を渡し，選択すべきタイルのインデックスを文字列で返させる．
+    # インデックスは左上を 1 として横方向に 1, 2, ... とする形．
+    # 入力を簡単にするため，10以上は a, b, ..., g で指定．
+    # 0 は入力の完了を意味する．
     wait.until(EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//iframe[@title="reCAPTCHA"]')))
     local_lib.selenium_util.click_xpath(driver, '//span[contains(@class, "recaptcha-checkbox")]')
     driver.switch_to.default_content()
@@ -96,29 +130,13 @@ def resolve_img_console(driver, wait, captcha_img_path):
     )
     wait.until(EC.element_to_be_clickable((By.XPATH, '//div[@id="rc-imageselect-target"]')))
     while True:
-        captcha_png_data = driver.find_element(By.XPATH, "//body").screenshot_as_png
-
-        logging.info("Save image: {path}".format(path=captcha_img_path))
-
-        with open(captcha_img_path, "wb") as f:
-            f.write(captcha_png_data)
-
         tile_list = driver.find_elements(
             By.XPATH,
             '//table[contains(@class, "rc-imageselect-table")]//td[@role="button"]',
         )
         tile_idx_list = list(map(lambda elem: elem.get_attribute("tabindex"), tile_list))
 
-        # NOTE: メールを見て人間に選択するべき画像のインデックスを入力してもらう．
-        # インデックスは左上を 1 として横方向に 1, 2, ... とする形．
-        # 入力を簡単にするため，10以上は a, b, ..., g で指定．
-        # 0 は入力の完了を意味する．
-        select_str = input(
-            (
-                "「{img_file}」を参照して，選択すべきタイルを指定してください．\n".format(img_file=captcha_img_path)
-                + "(左上を 1 として横方向に 1, 2, 3, ... として指定．0 は追加選択無し．): "
-            )
-        ).strip()
+        select_str = ask_func(driver.find_element(By.XPATH, "//body").screenshot_as_png)
 
         if select_str == "0":
             if local_lib.selenium_util.click_xpath(
@@ -148,7 +166,7 @@ def resolve_img_console(driver, wait, captcha_img_path):
             else:
                 idx = ord(idx_char) - 97 + 10
 
-            if idx > len(tile_idx_list):
+            if (idx < 1) or (idx > len(tile_idx_list)):
                 continue
 
             logging.info("select {index}".format(index=idx))
@@ -163,6 +181,39 @@ def resolve_img_console(driver, wait, captcha_img_path):
     driver.switch_to.default_content()
 
 
+def resolve_img_console(driver, wait, captcha_img_path):
+    def ask(png_data):
+        logging.info("Save image: {path}".format(path=captcha_img_path))
+
+        with open(captcha_img_path, "wb") as f:
+            f.write(png_data)
+
+        return input(
+            (
+                "「{img_file}」を参照して，選択すべきタイルを指定してください．\n".format(img_file=captcha_img_path)
+                + "(左上を 1 として横方向に 1, 2, 3, ... として指定．0 は追加選択無し．): "
+            )
+        ).strip()
+
+    resolve_img(driver, wait, ask)
+
+
+def resolve_img_web(driver, wait, timeout=None):
+    # NOTE: local_lib.captcha_handoff.start() で Web ページを公開しておくこと．
+    # ブラウザは問題を表示したままなので，このスレッドは回答が届くまで止まる．
+    # timeout は何度かタイルを選ぶ場合も含めた全体の上限で，超えると
+    # concurrent.futures.TimeoutError になる．
+    # 画像が前回と同じ場合，Web ページは更新されない．
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def ask(png_data):
+        if deadline is None:
+            return local_lib.captcha_handoff.ask(png_data)
+        return local_lib.captcha_handoff.ask(png_data, max(deadline - time.monotonic(), 0))
+
+    resolve_img(driver, wait, ask)
+
+
 def resolve_img_mail(driver, wait, config):
     wait.until(EC.frame_to_be_available_and_switch_to_it((By.XPATH, '//iframe[@title="reCAPTCHA"]')))
     local_lib.selenium_util.click_xpath(driver, '//span[contains(@class, "recaptcha-checkbox")]')
@@ -230,3 +281,16 @@ def resolve_img_mail(driver, wait, config):
         time.sleep(0.5)
 
     driver.switch_to.default_content()
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    with open(args["-f"], "rb") as f:
+        logging.info(recog_audio_data(f.read(), args["-e"]))
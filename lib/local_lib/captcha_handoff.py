@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像認証の問題をローカルの Web ページに表示し，人間からの回答を受け付けます．
+コンソールでの入力と違い，Web ページや他のスレッドは回答待ちの間も動作しますが，
+回答を待っているスレッド (巡回ではブラウザを操作するスレッド) は回答が届くまで止まります．
+回答を待つ時間には上限を設け，時間内に回答が無い場合は concurrent.futures.TimeoutError になります．
+
+Usage:
+  captcha_handoff.py [-p PORT] [-i IMAGE]
+
+Options:
+  -p PORT       : Web ページを公開するポート．[default: 9110]
+  -i IMAGE      : 表示する画像 (動作確認用)．
+"""
+
+import concurrent.futures
+import hashlib
+import html
+import http.server
+import logging
+import threading
+import urllib.parse
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>reCAPTCHA</title>
+</head>
+<body>
+<p>{message}</p>
+<img id="captcha" src="/image.png?version={version}">
+<form method="post" action="/answer">
+<input type="hidden" name="version" value="{version}">
+<input type="text" name="select" autofocus>
+<input type="submit" value="送信">
+</form>
+<p>左上を 1 として横方向に 1, 2, 3, ... として指定．10 以上は a, b, ... で指定．0 は追加選択無し．</p>
+<script>
+setInterval(function() {{
+  fetch("/version").then(function(res) {{ return res.text(); }}).then(function(version) {{
+    if (version != "{version}") location.reload();
+  }});
+}}, 1000);
+</script>
+</body>
+</html>
+"""
+
+_handoff = None
+
+
+def start(port):
+    global _handoff
+
+    _handoff = {
+        "lock": threading.Lock(),
+        "image": None,
+        "digest": None,
+        "version": 0,
+        "future": None,
+    }
+
+    # NOTE: 外部には公開しない
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), HandoffRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    _handoff["server"] = server
+
+    logging.info("Serve captcha on http://127.0.0.1:{port}/".format(port=port))
+
+
+def is_enabled():
+    return _handoff is not None
+
+
+def post_image(png_data):
+    # NOTE: 画像が変わっていない場合はページを更新しない
+    digest = hashlib.sha1(png_data).hexdigest()
+
+    with _handoff["lock"]:
+        if digest != _handoff["digest"]:
+            _handoff["image"] = png_data
+            _handoff["digest"] = digest
+            _handoff["version"] += 1
+
+            logging.info("Update captcha image (version {version})".format(version=_handoff["version"]))
+
+        if (_handoff["future"] is None) or _handoff["future"].done():
+            _handoff["future"] = concurrent.futures.Future()
+
+        return _handoff["future"]
+
+
+def ask(png_data, timeout=None):
+    future = post_image(png_data)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # NOTE: 時間切れ後に届いた回答は使わない
+        future.cancel()
+        raise
+
+
+def put_answer(select_str, version):
+    with _handoff["lock"]:
+        future = _handoff["future"]
+        # NOTE: 古い画像に対する回答を新しい画像に適用しないよう，表示していた版を照合する
+        if version != _handoff["version"]:
+            logging.warning(
+                "Ignore captcha answer for old image (version {version} != {current})".format(
+                    version=version, current=_handoff["version"]
+                )
+            )
+            return False
+
+    if (future is None) or future.done():
+        return False
+
+    future.set_result(select_str)
+
+    return True
+
+
+def stop():
+    global _handoff
+
+    if _handoff is None:
+        return
+
+    _handoff["server"].shutdown()
+
+    with _handoff["lock"]:
+        if (_handoff["future"] is not None) and (not _handoff["future"].done()):
+            _handoff["future"].cancel()
+
+    _handoff = None
+
+
+class HandoffRequestHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+
+        with _handoff["lock"]:
+            image = _handoff["image"]
+            version = _handoff["version"]
+            is_waiting = (_handoff["future"] is not None) and (not _handoff["future"].done())
+
+        if path == "/":
+            if image is None:
+                message = "現在，回答が必要な問題はありません．"
+            elif is_waiting:
+                message = "選択すべきタイルを指定してください．"
+            else:
+                message = "回答を反映しています..."
+
+            body = PAGE_TEMPLATE.format(message=html.escape(message), version=version).encode("utf-8")
+            self.send_body(body, "text/html; charset=utf-8")
+        elif path == "/version":
+            self.send_body(str(version).encode("utf-8"), "text/plain")
+        elif (path == "/image.png") and (image is not None):
+            self.send_body(image, "image/png")
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if urllib.parse.urlparse(self.path).path != "/answer":
+            return self.send_error(404)
+
+        length = int(self.headers.get("Content-Length", 0))
+        param = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+        select_str = param.get("select", [""])[0].strip()
+        try:
+            version = int(param.get("version", [""])[0])
+        except ValueError:
+            version = None
+
+        if put_answer(select_str, version):
+            logging.info("Receive captcha answer: {select}".format(select=select_str))
+
+        self.send_response(303)
+        self.send_header("Location", "/")
+        self.end_headers()
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    start(int(args["-p"]))
+
+    if args["-i"] is not None:
+        with open(args["-i"], "rb") as f:
+            logging.info("Answer: {select}".format(select=ask(f.read())))
+
+    stop()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebDriver のコマンド (ブラウザとの往復) の回数と所要時間を記録します．
+コマンドは，それを発行した関数と，処理単位 (注文，商品など) 毎に集計します．
+init() を呼ばない限り，wrap() や unit は何もしません．
+"""
+
+import functools
+import json
+import logging
+import pathlib
+import re
+import sys
+import threading
+import time
+
+SCRIPT_LABEL_PATTERN = re.compile(r"^/\* (\w+) \*/")
+SLOW_COMMAND_COUNT = 10
+
+_stat = None
+_local = threading.local()
+
+
+def init(report_path, module_prefix="store_monotaro"):
+    global _stat
+
+    _stat = {
+        "path": pathlib.Path(report_path),
+        "module_prefix": module_prefix,
+        "lock": threading.Lock(),
+        "command": {},
+        "func": {},
+        "unit": {},
+    }
+
+
+def is_enabled():
+    return _stat is not None
+
+
+def get_command_label(command, params):
+    # NOTE: get_attribute や is_displayed は executeScript として送られるので，
+    # スクリプト先頭のコメントで区別する
+    if (command == "executeScript") and (params is not None):
+        label = SCRIPT_LABEL_PATTERN.match(params.get("script", ""))
+        if label is not None:
+            return "executeScript:" + label.group(1)
+
+    return command
+
+
+def get_caller():
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals.get("__name__", "").startswith(_stat["module_prefix"]):
+            return frame.f_code.co_name
+        frame = frame.f_back
+
+    return "(other)"
+
+
+def add_stat(stat_map, key, elapsed):
+    if key not in stat_map:
+        stat_map[key] = {"count": 0, "time": 0.0, "max": 0.0}
+    stat_map[key]["count"] += 1
+    stat_map[key]["time"] += elapsed
+    stat_map[key]["max"] = max(stat_map[key]["max"], elapsed)
+
+
+def record(command, params, elapsed):
+    label = get_command_label(command, params)
+    caller = get_caller()
+
+    with _stat["lock"]:
+        add_stat(_stat["command"], label, elapsed)
+        add_stat(_stat["func"], caller, elapsed)
+
+        for name in getattr(_local, "unit_stack", []):
+            _stat["unit"][name]["command"] += 1
+            _stat["unit"][name]["time"] += elapsed
+
+
+def wrap(driver):
+    if _stat is None:
+        return driver
+
+    execute_orig = driver.execute
+
+    # NOTE: WebElement の操作も含め，全てのコマンドは driver.execute を経由する
+    def execute(command, params=None):
+        start = time.perf_counter()
+        try:
+            return execute_orig(command, params)
+        finally:
+            if _stat is not None:
+                record(command, params, time.perf_counter() - start)
+
+    driver.execute = execute
+
+    return driver
+
+
+class unit:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _stat is None:
+            return self
+
+        with _stat["lock"]:
+            if self.name not in _stat["unit"]:
+                _stat["unit"][self.name] = {"count": 0, "command": 0, "time": 0.0}
+            _stat["unit"][self.name]["count"] += 1
+
+        if not hasattr(_local, "unit_stack"):
+            _local.unit_stack = []
+        _local.unit_stack.append(self.name)
+
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if (_stat is None) or (not getattr(_local, "unit_stack", None)):
+            return
+
+        _local.unit_stack.pop()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def get_report():
+    if _stat is None:
+        return {}
+
+    with _stat["lock"]:
+        command = {key: value.copy() for key, value in _stat["command"].items()}
+        func = {key: value.copy() for key, value in _stat["func"].items()}
+        unit_stat = {key: value.copy() for key, value in _stat["unit"].items()}
+
+    for stat in list(command.values()) + list(func.values()):
+        stat["mean"] = stat["time"] / stat["count"]
+
+    for stat in unit_stat.values():
+        stat["command_per_unit"] = stat["command"] / stat["count"]
+        stat["time_per_unit"] = stat["time"] / stat["count"]
+
+    return {
+        "total": {
+            "count": sum(stat["count"] for stat in command.values()),
+            "time": sum(stat["time"] for stat in command.values()),
+        },
+        "unit": unit_stat,
+        "command": dict(sorted(command.items(), key=lambda x: -x[1]["time"])),
+        "func": dict(sorted(func.items(), key=lambda x: -x[1]["count"])),
+    }
+
+
+def log_report(report):
+    logging.info(
+        "WebDriver: {count:,} commands, {time:.1f} sec".format(
+            count=report["total"]["count"], time=report["total"]["time"]
+        )
+    )
+    for name, stat in report["unit"].items():
+        logging.info(
+            "  per {name}: {command:.1f} commands, {time:.3f} sec ({count:,} {name}s)".format(
+                name=name, command=stat["command_per_unit"], time=stat["time_per_unit"], count=stat["count"]
+            )
+        )
+    for name, stat in list(report["command"].items())[:SLOW_COMMAND_COUNT]:
+        logging.info(
+            "  {name:32s} {count:8,} {time:8.2f} sec (mean {mean:.4f}, max {max:.3f})".format(
+                name=name, **stat
+            )
+        )
+    for name, stat in report["func"].items():
+        logging.info("  {name:40s} {count:8,} {time:8.2f} sec".format(name=name, **stat))
+
+
+def finish():
+    global _stat
+
+    if _stat is None:
+        return
+
+    report = get_report()
+
+    _stat["path"].parent.mkdir(parents=True, exist_ok=True)
+    with open(_stat["path"], "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    log_report(report)
+    logging.info("Write WebDriver report to {path}".format(path=_stat["path"]))
+
+    _stat = None
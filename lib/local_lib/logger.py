@@ -6,6 +6,9 @@ import logging
 import logging.handlers
 import os
 import pathlib
+import queue
+import threading
+import time
 
 import coloredlogs
 
@@ -14,6 +17,11 @@ ROTATE_COUNT = 10
 
 LOG_FORMAT = "{name} %(asctime)s %(levelname)s [%(filename)s:%(lineno)s %(funcName)s] %(message)s"
 
+# NOTE: logging.info(..., extra=RATE_LIMIT) とすると，コンソールへの出力が間引かれる対象になる
+RATE_LIMIT = {"is_rate_limited": True}
+
+_listener = None
+
 
 def log_formatter(name):
     return logging.Formatter(fmt=LOG_FORMAT.format(name=name), datefmt="%Y-%m-%d %H:%M:%S")
@@ -30,30 +38,153 @@ class GZipRotator:
         os.remove(source)
 
 
-def init(name, level=logging.WARNING, log_dir_path=None, log_queue=None, is_str_log=False):
+class BackgroundRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    # NOTE: ログファイルのリネームだけ済ませて，世代のずらしと圧縮は別スレッドで行う．
+    # スレッドは前回のものの完了を待ってから処理するので，世代の順序は保たれる．
+    # 非 daemon スレッドなので，終了時には圧縮の完了を待つ．
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rotate_seq = 0
+        self.rotate_thread = None
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if self.backupCount > 0:
+            self.rotate_seq += 1
+            temp = "{base}.{seq}.tmp".format(base=self.baseFilename, seq=self.rotate_seq)
+            os.replace(self.baseFilename, temp)
+
+            self.rotate_thread = threading.Thread(target=self.rotate_worker, args=(temp, self.rotate_thread))
+            self.rotate_thread.start()
+
+        if not self.delay:
+            self.stream = self._open()
+
+    def rotate_worker(self, temp, prev_thread):
+        if prev_thread is not None:
+            prev_thread.join()
+
+        for i in range(self.backupCount - 1, 0, -1):
+            source = self.rotation_filename("{base}.{i}".format(base=self.baseFilename, i=i))
+            dest = self.rotation_filename("{base}.{i}".format(base=self.baseFilename, i=i + 1))
+            if os.path.exists(source):
+                os.replace(source, dest)
+
+        self.rotate(temp, self.rotation_filename(self.baseFilename + ".1"))
+
+    def close(self):
+        super().close()
+        if self.rotate_thread is not None:
+            self.rotate_thread.join()
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.window = 0
+        self.count = 0
+        self.dropped = 0
+
+    def filter(self, record):
+        if not getattr(record, "is_rate_limited", False):
+            return True
+
+        window = int(time.monotonic())
+        if window != self.window:
+            self.window = window
+            self.count = 0
+
+        self.count += 1
+        if self.count > self.limit:
+            self.dropped += 1
+            return False
+
+        return True
+
+
+def create_file_handler(name, log_dir_path, is_background=False):
+    log_dir_path = pathlib.Path(log_dir_path)
+    log_dir_path.mkdir(exist_ok=True, parents=True)
+
+    log_file_path = str(log_dir_path / "{name}.log".format(name=name))
+
+    logging.info("Log to {log_file_path}".format(log_file_path=log_file_path))
+
+    handler_class = BackgroundRotatingFileHandler if is_background else logging.handlers.RotatingFileHandler
+    log_handler = handler_class(
+        log_file_path,
+        encoding="utf8",
+        maxBytes=MAX_SIZE,
+        backupCount=ROTATE_COUNT,
+    )
+    log_handler.formatter = log_formatter(name)
+    log_handler.namer = GZipRotator.namer
+    log_handler.rotator = GZipRotator.rotator
+
+    return log_handler
+
+
+def init_queue(name, level, log_dir_path, rate_limit):
+    global _listener
+
+    logger = logging.getLogger()
+    logger.setLevel(level)
+
+    handler_list = []
     if os.environ.get("NO_COLORED_LOGS", "false") != "true":
-        coloredlogs.install(fmt=LOG_FORMAT.format(name=name), level=level)
+        console_handler = logging.StreamHandler()
+        console_handler.formatter = coloredlogs.ColoredFormatter(fmt=LOG_FORMAT.format(name=name))
+        if rate_limit is not None:
+            console_handler.addFilter(RateLimitFilter(rate_limit))
+        handler_list.append(console_handler)
+
+    # NOTE: リスナーの開始前に出力されたログはキューに溜まり，開始後に全てのハンドラに渡される
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
     if log_dir_path is not None:
-        log_dir_path = pathlib.Path(log_dir_path)
-        log_dir_path.mkdir(exist_ok=True, parents=True)
+        handler_list.append(create_file_handler(name, log_dir_path, True))
+
+    # NOTE: 整形，ファイルへの書き込み，ローテーションは全てリスナーのスレッドで行う．
+    # ハンドラはリスナーのスレッドが参照するので，開始前に全て揃えておく．
+    _listener = logging.handlers.QueueListener(log_queue, *handler_list, respect_handler_level=True)
+    _listener.start()
+
+
+def finish():
+    global _listener
+
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
 
-        log_file_path = str(log_dir_path / "{name}.log".format(name=name))
+    _listener = None
 
-        logging.info("Log to {log_file_path}".format(log_file_path=log_file_path))
 
-        logger = logging.getLogger()
-        log_handler = logging.handlers.RotatingFileHandler(
-            log_file_path,
-            encoding="utf8",
-            maxBytes=MAX_SIZE,
-            backupCount=ROTATE_COUNT,
-        )
-        log_handler.formatter = log_formatter(name)
-        log_handler.namer = GZipRotator.namer
-        log_handler.rotator = GZipRotator.rotator
+def init(
+    name,
+    level=logging.WARNING,
+    log_dir_path=None,
+    log_queue=None,
+    is_str_log=False,
+    is_queue=False,
+    rate_limit=None,
+):
+    if is_queue:
+        init_queue(name, level, log_dir_path, rate_limit)
+    else:
+        if os.environ.get("NO_COLORED_LOGS", "false") != "true":
+            coloredlogs.install(fmt=LOG_FORMAT.format(name=name), level=level)
 
-        logger.addHandler(log_handler)
+        if log_dir_path is not None:
+            logging.getLogger().addHandler(create_file_handler(name, log_dir_path))
 
     if log_queue is not None:
         handler = logging.handlers.QueueHandler(log_queue)
@@ -69,5 +200,8 @@ def init(name, level=logging.WARNING, log_dir_path=None, log_queue=None, is_str_
 
 
 if __name__ == "__main__":
-    init("test")
+    init("test", level=logging.INFO, is_queue=True, rate_limit=2)
     logging.info("Test")
+    for i in range(10):
+        logging.info("Item {i}".format(i=i), extra=RATE_LIMIT)
+    finish()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+処理の区切りでメモリの割り当て状況のスナップショットを採り，割り当ての多い箇所と
+ピーク時の RSS を記録します．上限を設定した場合は，超過時に警告もしくはエラーにします．
+init() を呼ばない限り，checkpoint は何もしません．
+"""
+
+import json
+import logging
+import pathlib
+import sys
+import tracemalloc
+
+TOP_COUNT = 10
+TRACE_FRAME_COUNT = 1
+
+_tracker = None
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def init(report_path, budget_mb=None, is_fail=False):
+    global _tracker
+
+    tracemalloc.start(TRACE_FRAME_COUNT)
+
+    _tracker = {
+        "path": pathlib.Path(report_path),
+        "budget": budget_mb,
+        "is_fail": is_fail,
+        "snapshot": None,
+        "checkpoint": [],
+    }
+
+
+def is_enabled():
+    return _tracker is not None
+
+
+def get_peak_rss_mb():
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # NOTE: macOS はバイト単位，Linux は KB 単位
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+
+    try:
+        import ctypes
+        import ctypes.wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", ctypes.wintypes.DWORD),
+                ("PageFaultCount", ctypes.wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+        )
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    except:
+        return None
+
+
+def gen_stat_list(stat_list):
+    return [
+        {
+            "site": "{file}:{line}".format(file=stat.traceback[0].filename, line=stat.traceback[0].lineno),
+            "size_mb": stat.size / (1024 * 1024),
+            "size_diff_mb": getattr(stat, "size_diff", stat.size) / (1024 * 1024),
+            "count": stat.count,
+        }
+        for stat in stat_list[:TOP_COUNT]
+    ]
+
+
+def check_budget(name, peak_mb):
+    if (_tracker["budget"] is None) or (peak_mb is None) or (peak_mb <= _tracker["budget"]):
+        return
+
+    message = "Memory budget exceeded at {name}: {peak:,.0f} MB > {budget:,} MB".format(
+        name=name, peak=peak_mb, budget=_tracker["budget"]
+    )
+    if _tracker["is_fail"]:
+        raise MemoryBudgetExceeded(message)
+    else:
+        logging.warning(message)
+
+
+def checkpoint(name, extra=None):
+    if _tracker is None:
+        return
+
+    if extra is None:
+        extra = {}
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    current, peak = tracemalloc.get_traced_memory()
+    rss_peak_mb = get_peak_rss_mb()
+
+    if _tracker["snapshot"] is not None:
+        diff_list = snapshot.compare_to(_tracker["snapshot"], "lineno")
+    else:
+        diff_list = snapshot.statistics("lineno")
+
+    info = {
+        "name": name,
+        "traced_mb": current / (1024 * 1024),
+        "traced_peak_mb": peak / (1024 * 1024),
+        "rss_peak_mb": rss_peak_mb,
+        "top": gen_stat_list(snapshot.statistics("lineno")),
+        "growth": gen_stat_list(diff_list),
+        **extra,
+    }
+    _tracker["checkpoint"].append(info)
+    _tracker["snapshot"] = snapshot
+
+    logging.info(
+        "Memory at {name}: traced {traced:,.1f} MB (peak {traced_peak:,.1f} MB), RSS peak {rss}".format(
+            name=name,
+            traced=info["traced_mb"],
+            traced_peak=info["traced_peak_mb"],
+            rss="{rss:,.1f} MB".format(rss=rss_peak_mb) if rss_peak_mb is not None else "unknown",
+        )
+    )
+
+    check_budget(name, rss_peak_mb if rss_peak_mb is not None else info["traced_peak_mb"])
+
+
+def finish():
+    global _tracker
+
+    if _tracker is None:
+        return
+
+    tracemalloc.stop()
+
+    report = {"budget_mb": _tracker["budget"], "checkpoint": _tracker["checkpoint"]}
+
+    _tracker["path"].parent.mkdir(parents=True, exist_ok=True)
+    with open(_tracker["path"], "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for info in _tracker["checkpoint"]:
+        logging.info("Top allocation growth at {name}:".format(name=info["name"]))
+        for stat in info["growth"][:5]:
+            logging.info("  {size_diff_mb:+9.1f} MB  {site}".format(**stat))
+
+    logging.info("Write memory report to {path}".format(path=_tracker["path"]))
+
+    _tracker = None
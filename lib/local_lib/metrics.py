@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+長時間の処理の進捗を示すメトリクスを集計します．
+Prometheus のテキスト形式で HTTP 公開し，終了時には JSON ファイルに書き出します．
+init() を呼ばない限り，各関数は何もしません．
+
+Usage:
+  metrics.py [-p PORT]
+
+Options:
+  -p PORT       : メトリクスを公開するポート．[default: 9100]
+"""
+
+import http.server
+import json
+import logging
+import pathlib
+import threading
+import time
+
+_metrics = None
+
+
+def init(prefix, json_path=None, port=None):
+    global _metrics
+
+    _metrics = {
+        "prefix": prefix,
+        "path": pathlib.Path(json_path) if json_path is not None else None,
+        "start": time.time(),
+        "lock": threading.Lock(),
+        "counter": {},
+        "gauge": {},
+        "server": None,
+    }
+
+    if port is not None:
+        _metrics["server"] = start_server(port)
+
+
+def is_enabled():
+    return _metrics is not None
+
+
+def inc(name, value=1):
+    if _metrics is None:
+        return
+
+    with _metrics["lock"]:
+        _metrics["counter"][name] = _metrics["counter"].get(name, 0) + value
+
+
+def get(name):
+    if _metrics is None:
+        return 0
+
+    with _metrics["lock"]:
+        return _metrics["counter"].get(name, 0)
+
+
+def set_gauge(name, value):
+    if _metrics is None:
+        return
+
+    with _metrics["lock"]:
+        _metrics["gauge"][name] = value
+
+
+def get_snapshot():
+    with _metrics["lock"]:
+        counter = _metrics["counter"].copy()
+        gauge = _metrics["gauge"].copy()
+
+    elapsed = time.time() - _metrics["start"]
+    rate = {name + "_per_sec": value / elapsed for name, value in counter.items() if elapsed > 0}
+
+    # NOTE: 「xxx_hit」と「xxx_miss」の組からヒット率を求める
+    ratio = {}
+    for base in {name.rsplit("_", 1)[0] for name in counter.keys() if name.endswith(("_hit", "_miss"))}:
+        hit = counter.get(base + "_hit", 0)
+        miss = counter.get(base + "_miss", 0)
+        ratio[base + "_hit_ratio"] = hit / (hit + miss)
+
+    return {"elapsed": elapsed, "counter": counter, "rate": rate, "ratio": ratio, "gauge": gauge}
+
+
+def gen_prometheus_text():
+    snapshot = get_snapshot()
+    prefix = _metrics["prefix"]
+
+    line_list = [
+        "# TYPE {prefix}_elapsed_seconds gauge".format(prefix=prefix),
+        "{prefix}_elapsed_seconds {value}".format(prefix=prefix, value=snapshot["elapsed"]),
+    ]
+    for kind, metric_type in [
+        ("counter", "counter"),
+        ("rate", "gauge"),
+        ("ratio", "gauge"),
+        ("gauge", "gauge"),
+    ]:
+        for name, value in sorted(snapshot[kind].items()):
+            full_name = "{prefix}_{name}".format(prefix=prefix, name=name)
+            if metric_type == "counter":
+                full_name += "_total"
+            line_list.append("# TYPE {name} {type}".format(name=full_name, type=metric_type))
+            line_list.append("{name} {value}".format(name=full_name, value=value))
+
+    return "\n".join(line_list) + "\n"
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def do_GET(self):
+        if (self.path != "/metrics") or (_metrics is None):
+            return self.send_error(404)
+
+        body = gen_prometheus_text().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(port):
+    # NOTE: 外部には公開しない
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    logging.info("Serve metrics on http://127.0.0.1:{port}/metrics".format(port=port))
+
+    return server
+
+
+def finish():
+    global _metrics
+
+    if _metrics is None:
+        return
+
+    snapshot = get_snapshot()
+
+    if _metrics["path"] is not None:
+        _metrics["path"].parent.mkdir(parents=True, exist_ok=True)
+        with open(_metrics["path"], "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+        logging.info("Write metrics to {path}".format(path=_metrics["path"]))
+
+    if _metrics["server"] is not None:
+        _metrics["server"].shutdown()
+
+    _metrics = None
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    init("test", port=int(args["-p"]))
+
+    while True:
+        inc("count")
+        time.sleep(1)
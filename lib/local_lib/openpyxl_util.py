@@ -78,7 +78,7 @@ def insert_table_item(sheet, row, item, is_need_thumb, thumb_path, sheet_def, ba
 
         if key == "category":
             for i in range(sheet_def["TABLE_HEADER"]["col"][key]["length"]):
-                if i < len(item["category"]):
+                if i < len(item.get("category", [])):
                     value = item[key][i]
                 else:
                     value = ""
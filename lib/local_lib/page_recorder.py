@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+直近に訪れたページの URL と所要時間，エラー時には HTML (圧縮済み) もリングバッファに記録しておき，
+エラー発生時にまとめてファイルに書き出します．
+書き出しは別スレッドで行い，フォルダ全体のサイズが上限を超えたら古いものから削除します．
+"""
+
+import collections
+import datetime
+import gzip
+import itertools
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+PAGE_COUNT = 10
+DISK_QUOTA = 100 * 1024 * 1024
+DUMP_PREFIX = "snapshot_"
+
+_recorder = {
+    "lock": threading.Lock(),
+    "page_list": collections.deque(maxlen=PAGE_COUNT),
+    "quota": DISK_QUOTA,
+    "seq": itertools.count(),
+}
+
+
+def init(page_count=PAGE_COUNT, quota=DISK_QUOTA):
+    with _recorder["lock"]:
+        _recorder["page_list"] = collections.deque(_recorder["page_list"], maxlen=page_count)
+        _recorder["quota"] = quota
+
+
+def record(url, html, timing=None):
+    page = {
+        "url": url,
+        "time": datetime.datetime.now().isoformat(),
+        "timing": timing if timing is not None else {},
+        # NOTE: エラー処理の最中に行うので，圧縮率より速度を優先する
+        "html": gzip.compress(html.encode("utf-8"), compresslevel=1) if html is not None else None,
+    }
+
+    with _recorder["lock"]:
+        _recorder["page_list"].append(page)
+
+
+def gen_dump_dir_path(dump_dir_path, reason):
+    return pathlib.Path(dump_dir_path) / "{prefix}{date}_{pid}_{seq:04d}_{reason}".format(
+        prefix=DUMP_PREFIX,
+        date=datetime.datetime.now().strftime("%Y%m%d_%H%M%S"),
+        pid=os.getpid(),
+        seq=next(_recorder["seq"]),
+        reason=reason,
+    )
+
+
+def write_snapshot(snapshot_dir_path, page_list, quota):
+    snapshot_dir_path.mkdir(parents=True, exist_ok=True)
+
+    index = []
+    for i, page in enumerate(page_list):
+        entry = {key: value for key, value in page.items() if key != "html"}
+        if page["html"] is not None:
+            entry["file"] = "{index:02d}.html.gz".format(index=i)
+            with open(snapshot_dir_path / entry["file"], "wb") as f:
+                f.write(page["html"])
+        index.append(entry)
+
+    with open(snapshot_dir_path / "index.json", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+
+    logging.info("Write page snapshot to {path}".format(path=snapshot_dir_path))
+
+    enforce_quota(snapshot_dir_path.parent, quota)
+
+
+def get_dir_size(dir_path):
+    return sum(path.stat().st_size for path in dir_path.rglob("*") if path.is_file())
+
+
+def enforce_quota(dump_dir_path, quota):
+    snapshot_list = sorted(
+        [(path, get_dir_size(path)) for path in dump_dir_path.glob(DUMP_PREFIX + "*") if path.is_dir()],
+        key=lambda x: x[0].stat().st_mtime,
+    )
+    total = sum(size for path, size in snapshot_list)
+
+    # NOTE: 直前に書き出したものは残す
+    for path, size in snapshot_list[:-1]:
+        if total <= quota:
+            break
+        logging.info("Remove {path} to keep disk quota".format(path=path))
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def flush(dump_dir_path, reason):
+    with _recorder["lock"]:
+        page_list = list(_recorder["page_list"])
+        quota = _recorder["quota"]
+
+    if len(page_list) == 0:
+        return None
+
+    snapshot_dir_path = gen_dump_dir_path(dump_dir_path, reason)
+
+    # NOTE: 非 daemon スレッドなので，終了時には書き出しの完了を待つ
+    thread = threading.Thread(target=write_snapshot, args=(snapshot_dir_path, page_list, quota))
+    thread.start()
+
+    return thread
+
+
+if __name__ == "__main__":
+    import local_lib.logger
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    for i in range(PAGE_COUNT + 5):
+        record("https://example.com/{i}".format(i=i), "<html>{i}</html>".format(i=i), {"load": time.time()})
+
+    flush("debug", "test").join()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+処理を複数の段に分け，段の間を上限付きのキューで繋いで並行に実行します．
+段毎にワーカー数を指定でき，終了時には各段のキューの深さと待ち時間を報告します．
+
+Usage:
+  pipeline.py [-n COUNT]
+
+Options:
+  -n COUNT      : 流すデータの数．[default: 100]
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import local_lib.profiler
+
+QUEUE_SIZE = 8
+
+_END = object()
+
+
+class stage:
+    def __init__(self, name, func, worker_count=1, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.worker_count = worker_count
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.alive_count = worker_count
+        self.stat = {
+            "count": 0,
+            "busy": 0.0,
+            # NOTE: 前段からの入力を待っていた時間
+            "starve": 0.0,
+            # NOTE: 次段のキューが一杯で待たされた時間
+            "block": 0.0,
+            "depth_sum": 0,
+            "depth_max": 0,
+        }
+
+    def put(self, data):
+        depth = self.queue.qsize()
+        with self.lock:
+            self.stat["depth_sum"] += depth
+            self.stat["depth_max"] = max(self.stat["depth_max"], depth)
+
+        self.queue.put(data)
+
+    def add_stat(self, key, value):
+        with self.lock:
+            self.stat[key] += value
+
+
+def worker(stage_list, index, error_list):
+    current = stage_list[index]
+    next_stage = stage_list[index + 1] if index + 1 < len(stage_list) else None
+
+    while True:
+        start = time.perf_counter()
+        data = current.queue.get()
+        current.add_stat("starve", time.perf_counter() - start)
+
+        if data is _END:
+            # NOTE: 同じ段の他のワーカーにも終了を伝え，最後の一つが次の段に伝える
+            current.queue.put(_END)
+            with current.lock:
+                current.alive_count -= 1
+                is_last = current.alive_count == 0
+            if is_last and (next_stage is not None):
+                next_stage.put(_END)
+            return
+
+        # NOTE: エラー発生後は，前段が詰まらないように読み捨てる
+        if len(error_list) != 0:
+            continue
+
+        start = time.perf_counter()
+        try:
+            result = current.func(data)
+        except Exception as e:
+            logging.warning("Error in stage {name}: {error}".format(name=current.name, error=e))
+            error_list.append(e)
+            continue
+        finally:
+            current.add_stat("busy", time.perf_counter() - start)
+        current.add_stat("count", 1)
+
+        # NOTE: None を返したデータは次の段に渡さない
+        if (next_stage is None) or (result is None):
+            continue
+
+        start = time.perf_counter()
+        next_stage.put(result)
+        current.add_stat("block", time.perf_counter() - start)
+
+
+def get_report(stage_list, elapsed):
+    report = {"elapsed": elapsed, "stage": {}}
+    for current in stage_list:
+        stat = current.stat
+        report["stage"][current.name] = {
+            "worker": current.worker_count,
+            "count": stat["count"],
+            "busy": stat["busy"],
+            "starve": stat["starve"],
+            "block": stat["block"],
+            "utilization": stat["busy"] / (elapsed * current.worker_count) if elapsed != 0 else 0,
+            "depth_avg": stat["depth_sum"] / max(stat["count"], 1),
+            "depth_max": stat["depth_max"],
+        }
+
+    return report
+
+
+def log_report(report):
+    logging.info("Pipeline finished in {elapsed:.1f} sec".format(elapsed=report["elapsed"]))
+    for name, stat in report["stage"].items():
+        logging.info(
+            (
+                "  {name:10s} x{worker}: {count:6,} items, busy {utilization:5.1%}, "
+                + "starve {starve:7.1f} sec, block {block:7.1f} sec, queue avg {depth_avg:4.1f} max {depth_max}"
+            ).format(name=name, **stat)
+        )
+
+
+def run(data_list, stage_list):
+    thread_list = []
+    error_list = []
+
+    start = time.perf_counter()
+    for index, current in enumerate(stage_list):
+        for i in range(current.worker_count):
+            thread = threading.Thread(
+                target=worker,
+                args=(stage_list, index, error_list),
+                name="{name}-{index}".format(name=current.name, index=i),
+                daemon=True,
+            )
+            thread.start()
+            # NOTE: プロファイラでは，パイプラインを開始した時点のフェーズの処理として扱う
+            local_lib.profiler.add_thread(thread)
+            thread_list.append(thread)
+
+    for data in data_list:
+        if len(error_list) != 0:
+            break
+        stage_list[0].put(data)
+    stage_list[0].put(_END)
+
+    for thread in thread_list:
+        thread.join()
+        local_lib.profiler.remove_thread(thread)
+
+    report = get_report(stage_list, time.perf_counter() - start)
+    log_report(report)
+
+    if len(error_list) != 0:
+        raise error_list[0]
+
+    return report
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    result_list = []
+
+    def slow(data):
+        time.sleep(0.01)
+        return data * 2
+
+    report = run(
+        range(int(args["-n"])),
+        [
+            stage("fetch", lambda data: data),
+            stage("download", slow, 4),
+            stage("persist", result_list.append),
+        ],
+    )
+
+    assert sorted(result_list) == [i * 2 for i in range(int(args["-n"]))]
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+別スレッドから一定間隔でスタックを採取する，軽量なサンプリングプロファイラです．
+フェーズ毎に，関数別の集計と，Flame Graph 用の collapsed stack 形式のファイルを書き出します．
+init() を呼ばない限り，phase は何もしません．
+採取するのは init() を呼んだスレッドと，add_thread() で登録したスレッドです．
+登録したスレッドは，登録した時点のフェーズに計上します．
+
+Usage:
+  profiler.py [-o OUTPUT_DIR]
+
+Options:
+  -o OUTPUT_DIR : プロファイル結果を書き出すフォルダ．[default: profile]
+"""
+
+import logging
+import os
+import pathlib
+import sys
+import threading
+import time
+
+SAMPLE_INTERVAL_SEC = 0.005
+TOP_FUNC_COUNT = 50
+ROOT_PHASE = "all"
+
+_profile = None
+
+
+def init(output_dir_path, interval_sec=SAMPLE_INTERVAL_SEC):
+    global _profile
+
+    _profile = {
+        "path": pathlib.Path(output_dir_path),
+        "interval": interval_sec,
+        "main_thread": threading.get_ident(),
+        "phase_stack": [],
+        "thread_phase": {},
+        "sample": {},
+        "count": 0,
+        "stop": threading.Event(),
+    }
+
+    _profile["thread"] = threading.Thread(target=sample_worker, args=(_profile,), daemon=True)
+    _profile["thread"].start()
+
+
+def is_enabled():
+    return _profile is not None
+
+
+def get_phase_name(profile):
+    return ".".join(profile["phase_stack"]) if len(profile["phase_stack"]) != 0 else ROOT_PHASE
+
+
+def add_thread(thread):
+    # NOTE: 開始済みのスレッドを，現在のフェーズの処理として採取対象に加える
+    if _profile is not None:
+        _profile["thread_phase"][thread.ident] = (thread.name, get_phase_name(_profile))
+
+
+def remove_thread(thread):
+    if _profile is not None:
+        _profile["thread_phase"].pop(thread.ident, None)
+
+
+class phase:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _profile is not None:
+            _profile["phase_stack"].append(self.name)
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if (_profile is not None) and (len(_profile["phase_stack"]) != 0):
+            _profile["phase_stack"].pop()
+
+
+def gen_frame_name(frame):
+    return "{file}:{func}".format(file=os.path.basename(frame.f_code.co_filename), func=frame.f_code.co_name)
+
+
+def gen_stack(frame):
+    name_list = []
+    while frame is not None:
+        name_list.append(gen_frame_name(frame))
+        frame = frame.f_back
+    name_list.reverse()
+
+    return name_list
+
+
+def sample_worker(profile):
+    # NOTE: フェーズは init() を呼んだスレッドで管理しているので，関係の無いスレッドは採取しない．
+    # 全てのスレッドを混ぜると，フェーズ毎の割合がスレッド数によって薄まってしまう．
+    main_ident = profile["main_thread"]
+    main_name = {thread.ident: thread.name for thread in threading.enumerate()}.get(
+        main_ident, str(main_ident)
+    )
+
+    while not profile["stop"].wait(profile["interval"]):
+        frame_map = sys._current_frames()
+
+        target_list = [(main_ident, main_name, get_phase_name(profile))]
+        for ident, (name, phase_name) in profile["thread_phase"].copy().items():
+            target_list.append((ident, name, phase_name))
+
+        for ident, name, phase_name in target_list:
+            if ident not in frame_map:
+                continue
+
+            sample = profile["sample"].setdefault(phase_name, {})
+            stack = ";".join([name] + gen_stack(frame_map[ident]))
+            sample[stack] = sample.get(stack, 0) + 1
+
+        profile["count"] += 1
+
+
+def gen_func_stat(sample):
+    self_count = {}
+    total_count = {}
+    for stack, count in sample.items():
+        frame_list = stack.split(";")[1:]
+        if len(frame_list) == 0:
+            continue
+
+        self_count[frame_list[-1]] = self_count.get(frame_list[-1], 0) + count
+        for name in set(frame_list):
+            total_count[name] = total_count.get(name, 0) + count
+
+    return (self_count, total_count)
+
+
+def write_phase(output_dir_path, phase_name, sample, interval_sec):
+    with open(output_dir_path / (phase_name + ".collapsed"), "w", encoding="utf-8") as f:
+        for stack, count in sorted(sample.items()):
+            f.write("{stack} {count}\n".format(stack=stack, count=count))
+
+    self_count, total_count = gen_func_stat(sample)
+    sample_count = sum(sample.values())
+
+    with open(output_dir_path / (phase_name + ".txt"), "w", encoding="utf-8") as f:
+        f.write(
+            "# phase: {phase}, samples: {count:,} (interval {interval} sec)\n".format(
+                phase=phase_name, count=sample_count, interval=interval_sec
+            )
+        )
+        f.write("{self:>8s} {total:>8s}  function\n".format(self="self%", total="total%"))
+        for name, count in sorted(self_count.items(), key=lambda x: -x[1])[:TOP_FUNC_COUNT]:
+            f.write(
+                "{self:8.1%} {total:8.1%}  {name}\n".format(
+                    self=count / sample_count, total=total_count[name] / sample_count, name=name
+                )
+            )
+
+
+def finish():
+    global _profile
+
+    if _profile is None:
+        return
+
+    _profile["stop"].set()
+    _profile["thread"].join()
+
+    output_dir_path = _profile["path"]
+    output_dir_path.mkdir(parents=True, exist_ok=True)
+
+    sample_all = {}
+    for phase_name, sample in _profile["sample"].items():
+        if len(sample) == 0:
+            continue
+        write_phase(output_dir_path, phase_name, sample, _profile["interval"])
+        for stack, count in sample.items():
+            sample_all[stack] = sample_all.get(stack, 0) + count
+
+    # NOTE: 全フェーズを合わせたものも出力する
+    if len(sample_all) != 0:
+        write_phase(output_dir_path, "total", sample_all, _profile["interval"])
+
+    logging.info(
+        "Write profile ({count:,} samples) to {path}".format(count=_profile["count"], path=output_dir_path)
+    )
+
+    _profile = None
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    init(args["-o"])
+
+    def busy(sec):
+        start = time.time()
+        while time.time() - start < sec:
+            pass
+
+    with phase("first"):
+        busy(0.5)
+    with phase("second"):
+        busy(0.3)
+        time.sleep(0.2)
+
+    finish()
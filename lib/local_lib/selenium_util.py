@@ -5,8 +5,8 @@ import datetime
 import inspect
 import logging
 import os
+import pathlib
 import random
-import subprocess
 import time
 
 
@@ -201,13 +201,53 @@ def clean_dump(dump_path, keep_days=1):
             item.unlink(missing_ok=True)
 
 
-def get_memory_info(driver):
-    total = subprocess.Popen(
-        "smem -t -c pss -P chrome | tail -n 1", shell=True, stdout=subprocess.PIPE
-    ).communicate()[0]
-    total = int(str(total, "utf-8").strip()) // 1024
+def get_process_pss(pid):
+    # NOTE: Chrome のプロセス間で共有しているページを重複して数えないよう，RSS ではなく PSS を使う
+    try:
+        for line in pathlib.Path("/proc", str(pid), "smaps_rollup").read_text().split("\n"):
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # NOTE: smaps_rollup が無い古いカーネルでは，RSS で代用する
+    return int(pathlib.Path("/proc", str(pid), "statm").read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE")
 
-    js_heap = driver.execute_script("return window.performance.memory.usedJSHeapSize") // (1024 * 1024)
+
+def get_process_tree_pss(root_pid):
+    # NOTE: /proc から chromedriver 配下のプロセスを辿って PSS を合計する (Linux のみ)
+    child_map = {}
+    for stat_path in pathlib.Path("/proc").glob("[0-9]*/stat"):
+        try:
+            stat = stat_path.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        child_map.setdefault(int(stat[1]), []).append(int(stat_path.parent.name))
+
+    total = 0
+    pid_list = [root_pid]
+    while len(pid_list) != 0:
+        pid = pid_list.pop()
+        try:
+            total += get_process_pss(pid)
+        except OSError:
+            continue
+        pid_list.extend(child_map.get(pid, []))
+
+    return total
+
+
+def get_memory_info(driver, is_js_heap=True):
+    if pathlib.Path("/proc").is_dir():
+        total = get_process_tree_pss(driver.service.process.pid) // (1024 * 1024)
+    else:
+        # NOTE: /proc が無い環境では，ブラウザ全体の代わりに JS ヒープの使用量で代用する
+        total = driver.execute_cdp_cmd("Runtime.getHeapUsage", {})["totalSize"] // (1024 * 1024)
+
+    if is_js_heap:
+        js_heap = driver.execute_script("return window.performance.memory.usedJSHeapSize") // (1024 * 1024)
+    else:
+        js_heap = None
 
     return {"total": total, "js_heap": js_heap}
 
@@ -254,5 +294,29 @@ class browser_tab:
         time.sleep(0.1)
 
 
+def open_worker_tab(driver):
+    main_tab = driver.current_window_handle
+
+    driver.switch_to.new_window("tab")
+    tab = driver.current_window_handle
+    driver.switch_to.window(main_tab)
+
+    return tab
+
+
+class worker_tab:
+    # NOTE: 開いたままのタブに切り替えて使う．タブの開閉や待ち時間が不要になる
+    def __init__(self, driver, tab):
+        self.driver = driver
+        self.tab = tab
+
+    def __enter__(self):
+        self.main_tab = self.driver.current_window_handle
+        self.driver.switch_to.window(self.tab)
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.driver.switch_to.window(self.main_tab)
+
+
 if __name__ == "__main__":
     clean_dump()
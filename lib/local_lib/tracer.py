@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+処理をフェーズ毎に区切って所要時間を記録し，Chrome のトレースイベント形式
+(chrome://tracing や Perfetto で表示可能) で書き出します．
+init() を呼ばない限り，span は何もしません．
+
+Usage:
+  tracer.py [-o TRACE]
+
+Options:
+  -o TRACE      : トレースを書き出すファイル．[default: trace.json]
+"""
+
+import functools
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+# NOTE: 長時間の実行でメモリを使い過ぎないよう，イベントの記録数に上限を設ける．
+# 上限を超えても集計は続ける．
+MAX_EVENT_COUNT = 1000000
+
+_trace = None
+_local = threading.local()
+
+
+def init(trace_path):
+    global _trace
+
+    _trace = {
+        "path": pathlib.Path(trace_path),
+        "start": time.perf_counter_ns(),
+        "lock": threading.Lock(),
+        "event_list": [],
+        "duration": {},
+        "dropped": 0,
+    }
+
+
+def is_enabled():
+    return _trace is not None
+
+
+class span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _trace is None:
+            return self
+
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        _local.stack.append(time.perf_counter_ns())
+
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if (_trace is None) or (not getattr(_local, "stack", None)):
+            return
+
+        end = time.perf_counter_ns()
+        start = _local.stack.pop()
+
+        with _trace["lock"]:
+            _trace["duration"].setdefault(self.name, []).append(end - start)
+
+            if len(_trace["event_list"]) < MAX_EVENT_COUNT:
+                _trace["event_list"].append((self.name, start, end - start, threading.get_ident()))
+            else:
+                _trace["dropped"] += 1
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def percentile(sorted_list, ratio):
+    return sorted_list[min(len(sorted_list) - 1, int(len(sorted_list) * ratio))]
+
+
+def get_summary():
+    if _trace is None:
+        return {}
+
+    with _trace["lock"]:
+        duration_map = {name: sorted(duration_list) for name, duration_list in _trace["duration"].items()}
+
+    return {
+        name: {
+            "count": len(duration_list),
+            "total": sum(duration_list) / 1e9,
+            "p50": percentile(duration_list, 0.5) / 1e9,
+            "p95": percentile(duration_list, 0.95) / 1e9,
+        }
+        for name, duration_list in sorted(duration_map.items(), key=lambda x: -sum(x[1]))
+    }
+
+
+def log_summary(summary):
+    logging.info("Trace summary:")
+    logging.info(
+        "{name:24s} {count:>8s} {total:>10s} {p50:>9s} {p95:>9s}".format(
+            name="phase", count="count", total="total[s]", p50="p50[s]", p95="p95[s]"
+        )
+    )
+    for name, stat in summary.items():
+        logging.info("{name:24s} {count:8,} {total:10.2f} {p50:9.3f} {p95:9.3f}".format(name=name, **stat))
+
+
+def finish():
+    global _trace
+
+    if _trace is None:
+        return
+
+    summary = get_summary()
+    pid = os.getpid()
+
+    with _trace["lock"]:
+        event_list = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - _trace["start"]) / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, start, duration, tid in _trace["event_list"]
+        ]
+        dropped = _trace["dropped"]
+
+    _trace["path"].parent.mkdir(parents=True, exist_ok=True)
+    with open(_trace["path"], "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "traceEvents": event_list,
+                "displayTimeUnit": "ms",
+                "otherData": {"summary": summary, "dropped_event": dropped},
+            },
+            f,
+        )
+
+    summary_path = _trace["path"].with_suffix(".summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    log_summary(summary)
+    logging.info("Write trace to {path}".format(path=_trace["path"]))
+
+    _trace = None
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    init(args["-o"])
+
+    @span("sleep")
+    def sleep(sec):
+        time.sleep(sec)
+
+    with span("test"):
+        for i in range(10):
+            sleep(0.01 * i)
+
+    finish()
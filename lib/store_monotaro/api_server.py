@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+収集した購入履歴を，ローカルの HTTP JSON API として公開します．
+
+  GET /api/item?page=1&per_page=100&from=2023-01-01&to=2023-12-31&category=工具
+  GET /api/order?page=1&per_page=100&from=2023-01-01&to=2023-12-31
+  GET /api/thumb/<商品ID>.png
+
+応答には，キャッシュの更新日時から求めた ETag と Last-Modified を付けるので，
+If-None-Match や If-Modified-Since による再検証が行えます．
+
+Usage:
+  api_server.py [-c CONFIG] [-p PORT]
+
+Options:
+  -c CONFIG     : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
+  -p PORT       : API を公開するポート．[default: 9120]
+"""
+
+import datetime
+import email.utils
+import http.server
+import json
+import logging
+import re
+import threading
+import urllib.parse
+import zlib
+
+import store_monotaro.handle
+
+PER_PAGE_DEFAULT = 100
+PER_PAGE_MAX = 1000
+THUMB_PATH_PATTERN = re.compile(r"^/api/thumb/(\w+)\.png$")
+
+
+class ApiServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handle, is_reload):
+        super().__init__(address, ApiRequestHandler)
+        self.handle = handle
+        self.is_reload = is_reload
+        self.lock = threading.Lock()
+        self.cache_mtime = None
+        self.item_list = None
+        self.last_modified = None
+
+    def get_data(self):
+        with self.lock:
+            # NOTE: キャッシュファイルが更新されていたら読み込み直す
+            if self.is_reload:
+                cache_path = store_monotaro.handle.get_caceh_file_path(self.handle)
+                mtime = cache_path.stat().st_mtime if cache_path.exists() else None
+                if mtime != self.cache_mtime:
+                    logging.info("Reload {path}".format(path=cache_path))
+                    store_monotaro.handle.load_order_info(self.handle)
+                    self.cache_mtime = mtime
+                    self.last_modified = None
+
+            last_modified = store_monotaro.handle.get_cache_last_modified(self.handle)
+            if last_modified != self.last_modified:
+                self.item_list = store_monotaro.handle.get_item_list(self.handle)
+                self.last_modified = last_modified
+
+            return (self.item_list, self.last_modified)
+
+
+def parse_date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d") if text is not None else None
+
+
+def filter_item_list(item_list, query):
+    date_from = parse_date(query.get("from"))
+    date_to = parse_date(query.get("to"))
+    category = query.get("category")
+
+    if date_from is not None:
+        item_list = [item for item in item_list if item["date"] >= date_from]
+    if date_to is not None:
+        date_to += datetime.timedelta(days=1)
+        item_list = [item for item in item_list if item["date"] < date_to]
+    if category is not None:
+        item_list = [item for item in item_list if category in item.get("category", [])]
+
+    return item_list
+
+
+def gen_order_list(item_list):
+    order_map = {}
+    for item in item_list:
+        if item["no"] not in order_map:
+            order_map[item["no"]] = {
+                "no": item["no"],
+                "date": item["date"],
+                "url": store_monotaro.handle.gen_detail_url(item),
+                "item_count": 0,
+                "price": 0,
+            }
+        order_map[item["no"]]["item_count"] += 1
+        order_map[item["no"]]["price"] += item["price"]
+
+    return list(order_map.values())
+
+
+def paginate(data_list, query):
+    page = max(int(query.get("page", 1)), 1)
+    per_page = min(max(int(query.get("per_page", PER_PAGE_DEFAULT)), 1), PER_PAGE_MAX)
+
+    return {
+        "page": page,
+        "per_page": per_page,
+        "total": len(data_list),
+        "page_count": (len(data_list) + per_page - 1) // per_page,
+        "data": data_list[(page - 1) * per_page : page * per_page],
+    }
+
+
+def gen_etag(*key_list):
+    return 'W/"{key}"'.format(key="-".join(str(key) for key in key_list))
+
+
+def gen_http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+class ApiRequestHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def is_not_modified(self, etag, timestamp):
+        if "If-None-Match" in self.headers:
+            return etag in [tag.strip() for tag in self.headers["If-None-Match"].split(",")]
+
+        if "If-Modified-Since" in self.headers:
+            try:
+                since = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp()
+            except:
+                return False
+            return int(timestamp) <= since
+
+        return False
+
+    def send_not_modified(self, etag):
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+    def send_body(self, body, content_type, etag, timestamp):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", gen_http_date(timestamp))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, last_modified):
+        timestamp = last_modified.timestamp()
+        # NOTE: 同じ URL への応答は，キャッシュが更新されない限り同じ内容になる
+        etag = gen_etag(int(timestamp * 1000), zlib.crc32(self.path.encode("utf-8")))
+
+        if self.is_not_modified(etag, timestamp):
+            return self.send_not_modified(etag)
+
+        body = json.dumps(data, ensure_ascii=False, default=lambda x: x.isoformat()).encode("utf-8")
+        self.send_body(body, "application/json; charset=utf-8", etag, timestamp)
+
+    def send_thumb(self, item_id):
+        thumb_path = store_monotaro.handle.get_thumb_path(self.server.handle, {"id": item_id})
+        if not thumb_path.exists():
+            return self.send_error(404)
+
+        stat = thumb_path.stat()
+        etag = gen_etag(stat.st_mtime_ns, stat.st_size)
+
+        if self.is_not_modified(etag, stat.st_mtime):
+            return self.send_not_modified(etag)
+
+        with open(thumb_path, "rb") as f:
+            self.send_body(f.read(), "image/png", etag, stat.st_mtime)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = {key: value[0] for key, value in urllib.parse.parse_qs(url.query).items()}
+
+        try:
+            if url.path == "/api/item":
+                item_list, last_modified = self.server.get_data()
+                self.send_json(paginate(filter_item_list(item_list, query), query), last_modified)
+            elif url.path == "/api/order":
+                item_list, last_modified = self.server.get_data()
+                self.send_json(
+                    paginate(gen_order_list(filter_item_list(item_list, query)), query), last_modified
+                )
+            elif THUMB_PATH_PATTERN.match(url.path):
+                self.send_thumb(THUMB_PATH_PATTERN.match(url.path).group(1))
+            else:
+                self.send_error(404)
+        except ValueError:
+            self.send_error(400)
+
+
+def start(handle, port, is_reload=True):
+    # NOTE: 外部には公開しない
+    server = ApiServer(("127.0.0.1", port), handle, is_reload)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    logging.info("Serve API on http://127.0.0.1:{port}/api/".format(port=port))
+
+    return server
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+    import local_lib.config
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("test", level=logging.INFO)
+
+    config = local_lib.config.load(args["-c"])
+    handle = store_monotaro.handle.create(config, is_progress=False)
+
+    server = ApiServer(("127.0.0.1", int(args["-p"])), handle, True)
+    logging.info("Serve API on http://127.0.0.1:{port}/api/".format(port=args["-p"]))
+    server.serve_forever()
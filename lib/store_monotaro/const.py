@@ -1,18 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 
-HIST_URL = (
-    "https://www.monotaro.com/monotaroMain.py?func=monotaro.orderHistory.showListServlet.ShowListServlet"
-)
+# NOTE: オフラインでのベンチマーク用に，ローカルの代替サイトに向けられるようにしておく．
+# 環境変数 MOHIST_MONOTARO_URL で指定するか，実行時に BASE_URL を書き換える．
+BASE_URL = os.environ.get("MOHIST_MONOTARO_URL", "https://www.monotaro.com").rstrip("/")
+
+HIST_PATH = "/monotaroMain.py?func=monotaro.orderHistory.showListServlet.ShowListServlet"
 
-HIST_URL_BY_MONTH = (
-    "https://www.monotaro.com/monotaroMain.py"
+HIST_PATH_BY_MONTH = (
+    "/monotaroMain.py"
     + "?func=monotaro.orderHistory.showListServlet.ShowListServlet&targetMonth={year}-{month}"
 )
 
-DETAIL_URL_BY_LINK_NO = (
-    "https://www.monotaro.com/monotaroMain.py"
-    + "?func=monotaro.orderHistory.showReadServlet.ShowReadServlet&recvOrderNo={link_no}"
+DETAIL_PATH_BY_LINK_NO = (
+    "/monotaroMain.py" + "?func=monotaro.orderHistory.showReadServlet.ShowReadServlet&recvOrderNo={link_no}"
 )
 
 
@@ -4,16 +4,28 @@
 モノタロウから購入履歴を収集します．
 
 Usage:
-  crawler.py [-c CONFIG]
+  crawler.py [-c CONFIG] [-L LIMIT] [-T TRACE] [-W REPORT] [-m METRICS] [-p PORT] [--profile PROFILE_DIR] [--newest-first] [--budget MIN] [--no-thumb]
+  crawler.py [-c CONFIG] --plan
 
 Options:
   -c CONFIG     : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
+  -L LIMIT      : 商品毎のログのコンソールへの出力を，毎秒 LIMIT 行までに間引きます．
+  -T TRACE      : 処理のフェーズ毎の所要時間を TRACE に書き出します．
+  -W REPORT     : WebDriver のコマンドの回数と所要時間を REPORT に書き出します．
+  -m METRICS    : 処理速度などのメトリクスを終了時に METRICS に書き出します．
+  -p PORT       : メトリクスを Prometheus 形式で PORT に公開します．
+  --profile PROFILE_DIR : サンプリングプロファイラを有効にし，結果を PROFILE_DIR に書き出します．
+  --newest-first  : 新しい月から順に収集します．
+  --budget MIN  : 収集を MIN 分で打ち切り，残りは次回に続きから収集します．
+  --no-thumb    : サムネイル画像は取得せず，URL のみ記録します．(後で thumbnail.py で取得できます)
+  --plan        : 収集は行わず，取得が必要なページの数と所要時間の見積もりを表示します．
 """
 
+import concurrent.futures
 import logging
-import random
 import re
 import datetime
+import hashlib
 import time
 import traceback
 
@@ -22,23 +34,74 @@ from selenium.webdriver.support import expected_conditions as EC
 
 import store_monotaro.const
 import store_monotaro.handle
-
-import local_lib.captcha
+import store_monotaro.thumbnail
+
+import local_lib.captcha_handoff
+import local_lib.driver_telemetry
+import local_lib.logger
+import local_lib.memory_tracker
+import local_lib.metrics
+import local_lib.page_recorder
+import local_lib.pipeline
+import local_lib.profiler
 import local_lib.selenium_util
+import local_lib.tracer
 
 STATUS_MONTH_COUNT = "[collect] Count of month"
 STATUS_MONTH_ORDER = "[collect] Order of month"
 STATUS_ORDER_ITEM_ALL = "[collect] All orders"
+STATUS_ENRICH_ITEM = "[collect] Product detail"
 
 LOGIN_RETRY_COUNT = 2
 FETCH_RETRY_COUNT = 3
+RETRY_BACKOFF_SEC = 1
+ENRICH_STORE_INTERVAL = 20
+
+MEMORY_SAMPLE_INTERVAL = 50
+PRODUCT_SCRIPT = """/* parse_item_detail */
+var name = document.querySelector('h1[class*="ProductName"]');
+return {
+  name: name ? name.innerText : null,
+  breadcrumb: Array.from(document.querySelectorAll('ul[class*="BreadCrumbs"] > li')).map(function(li) {
+    return li.innerText;
+  })
+};
+"""
+TRANSFER_SIZE_SCRIPT = (
+    'return performance.getEntriesByType("navigation").reduce((sum, entry) => sum + entry.transferSize, 0);'
+)
+
+# NOTE: 注文一覧の解析を一回の往復で済ませるため，ブラウザ側でまとめて取り出す
+ORDER_LIST_SCRIPT = """/* parse_order_list */
+return Array.from(document.querySelectorAll('div[class*="orderHistory_list_box"]')).map(function(box) {
+  function text(selector) {
+    var elem = box.querySelector(selector);
+    return elem ? elem.innerText.trim() : null;
+  }
+  var button = box.querySelector('div[class*="OrderStatusArea"] > a[class*="Button"]');
+  return {
+    date: text('p[class*="detail_guide"] > strong'),
+    total_price: text('p[class*="detail_guide"] > span[class*="price"]'),
+    no: text('div[class*="DeteilItem"] > span[class*="DeteilItem__Text"]'),
+    link_no: button ? button.getAttribute("data-ee-recv-order-no") : null,
+    status: text('div[class*="OrderStatusArea"]')
+  };
+});
+"""
+
+
+class LoginError(Exception):
+    pass
 
 
+@local_lib.tracer.span("wait_for_loading")
 def wait_for_loading(handle, xpath='//div[@id="globalMenu"]', sec=1):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
     wait.until(EC.visibility_of_all_elements_located((By.XPATH, xpath)))
-    time.sleep(sec)
+
+    with local_lib.tracer.span("sleep"):
+        time.sleep(sec)
 
 
 def parse_month(month_text):
@@ -49,52 +112,274 @@ def parse_datetime(datetime_text):
     return datetime.datetime.strptime(datetime_text, "%Y/%m/%d %H:%M:%S")
 
 
+def parse_price(price_text):
+    return int(re.match(r".*?(\d{1,3}(?:,\d{3})*)", price_text).group(1).replace(",", ""))
+
+
+def parse_tax(tax_text):
+    return int(re.match(r"(\d+)", tax_text).group(1)) / 100
+
+
+def parse_order_no(no_text):
+    return re.match(r"注文書番号：(\d+)", no_text).group(1)
+
+
+def gen_url(path):
+    return store_monotaro.handle.gen_url(path)
+
+
 def gen_hist_url(date):
-    return store_monotaro.const.HIST_URL_BY_MONTH.format(year=date.year, month=date.month)
+    return store_monotaro.handle.gen_hist_url(date)
 
 
 def gen_detail_url(order_info):
-    return store_monotaro.const.DETAIL_URL_BY_LINK_NO.format(link_no=order_info["link_no"])
+    return store_monotaro.handle.gen_detail_url(order_info)
 
 
 def gen_month_str(date):
     return date.strftime("%Y年 %m月")
 
 
+def count_page(handle):
+    local_lib.metrics.inc("page")
+
+    check_browser_memory(handle)
+
+    if not local_lib.metrics.is_enabled():
+        return
+
+    driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+
+    local_lib.metrics.inc("download_bytes", driver.execute_script(TRANSFER_SIZE_SCRIPT) or 0)
+
+    if local_lib.metrics.get("page") % MEMORY_SAMPLE_INTERVAL == 1:
+        try:
+            mem_info = local_lib.selenium_util.get_memory_info(driver)
+            local_lib.metrics.set_gauge("chrome_memory_mb", mem_info["total"])
+            local_lib.metrics.set_gauge("chrome_js_heap_mb", mem_info["js_heap"])
+        except:
+            logging.debug("Failed to get memory info of Chrome")
+
+
+def check_browser_memory(handle):
+    memory_limit = store_monotaro.handle.get_browser_memory_limit(handle)
+    if memory_limit is None:
+        return
+
+    handle["browser_page_count"] = handle.get("browser_page_count", 0) + 1
+    if handle["browser_page_count"] % store_monotaro.handle.get_browser_check_interval(handle) != 0:
+        return
+
+    driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+    try:
+        memory = local_lib.selenium_util.get_memory_info(driver, is_js_heap=False)["total"]
+    except:
+        logging.debug("Failed to get memory info of Chrome")
+        return
+
+    local_lib.metrics.set_gauge("chrome_memory_mb", memory)
+
+    if memory > memory_limit:
+        logging.info(
+            "Chrome memory {memory:,} MB exceeds {limit:,} MB, recycle it at next order".format(
+                memory=memory, limit=memory_limit
+            )
+        )
+        # NOTE: 注文の処理の途中で再起動しないよう，ここでは印を付けるだけにする
+        handle["browser_need_recycle"] = True
+
+
+def recycle_browser_if_needed(handle):
+    if not handle.get("browser_need_recycle", False):
+        return
+
+    store_monotaro.handle.set_status(handle, "ブラウザを再起動しています...")
+    store_monotaro.handle.recycle_selenium_driver(handle)
+    handle["browser_need_recycle"] = False
+
+    local_lib.metrics.inc("browser_recycle")
+
+
+@local_lib.tracer.span("visit_url")
 def visit_url(handle, url, xpath='//div[@id="globalMenu"]'):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
-    driver.get(url)
-    wait_for_loading(handle, xpath)
+    start = time.perf_counter()
+    try:
+        driver.get(url)
+        wait_for_loading(handle, xpath)
+    except:
+        record_page(handle, url, {"load": time.perf_counter() - start})
+        raise
+
+    # NOTE: HTML の取得と圧縮は重いので，正常に表示できた場合は URL と所要時間だけ記録する
+    local_lib.page_recorder.record(url, None, {"load": time.perf_counter() - start})
 
+    count_page(handle)
 
-def save_thumbnail(handle, item, thumb_url):
+
+def record_page(handle, url=None, timing=None):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
-    with local_lib.selenium_util.browser_tab(driver, thumb_url):
-        png_data = driver.find_element(By.XPATH, "//img").screenshot_as_png
+    try:
+        url = url if url is not None else driver.current_url
+        local_lib.page_recorder.record(url, driver.page_source, timing)
+    except:
+        local_lib.page_recorder.record(url, None, timing)
 
-        with open(store_monotaro.handle.get_thumb_path(handle, item), "wb") as f:
-            f.write(png_data)
 
+def dump_page(handle, reason):
+    # NOTE: 表示は成功したものの解析に失敗した場合に備えて，書き出す前に表示中のページを記録する
+    record_page(handle)
+    local_lib.page_recorder.flush(store_monotaro.handle.get_debug_dir_path(handle), reason)
 
+
+@local_lib.tracer.span("fetch_item_detail")
+@local_lib.driver_telemetry.unit("product")
 def fetch_item_detail(handle, item):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
-    with local_lib.selenium_util.browser_tab(driver, item["url"]):
-        wait_for_loading(handle)
+    with store_monotaro.handle.get_worker_tab(handle):
+        visit_url(handle, item["url"])
+
+        local_lib.metrics.inc("product_cache_miss")
+
+        return driver.execute_script(PRODUCT_SCRIPT)
+
+
+def parse_item_detail(product):
+    category = product["breadcrumb"]
 
-        item["name"] = driver.find_element(By.XPATH, '//h1[contains(@class, "ProductName")]').text
+    if len(category) > 1:
+        category = category[1:]
 
-        breadcrumb_list = driver.find_elements(By.XPATH, '//ul[contains(@class, "BreadCrumbs")]/li')
-        category = list(map(lambda x: x.text, breadcrumb_list))
+    return {"name": product["name"], "category": category}
 
-        if len(category) > 1:
-            category.pop(0)
 
-        item["category"] = category
+def enrich_fetch_stage(handle, item_list):
+    # NOTE: 時間切れの場合は，残りを次回に回す
+    if is_budget_exhausted(handle):
+        return None
 
+    recycle_browser_if_needed(handle)
 
+    start = time.perf_counter()
+    try:
+        product = fetch_item_detail(handle, item_list[0])
+        return {
+            "item_list": item_list,
+            "product": product,
+            "latency": {"product": time.perf_counter() - start},
+        }
+    except:
+        # NOTE: 次回の実行時に改めて収集する
+        logging.warning("Failed to fetch detail of {id}".format(id=item_list[0]["id"]))
+        logging.debug(traceback.format_exc())
+        local_lib.metrics.inc("product_error")
+        return None
+
+
+def enrich_parse_stage(data):
+    if data["product"]["name"] is None:
+        logging.warning("Failed to parse detail of {id}".format(id=data["item_list"][0]["id"]))
+        local_lib.metrics.inc("product_error")
+        # NOTE: 商品ページが無くなった商品を毎回取得し直さないよう，分類無しとしてキャッシュする
+        data.pop("product")
+        data["product_info"] = {"category": []}
+        return data
+
+    data["product_info"] = parse_item_detail(data.pop("product"))
+    return data
+
+
+def enrich_download_stage(handle, data):
+    thumb_url = data["item_list"][0].get("thumb_url")
+
+    data["png_data"] = None
+    # NOTE: サムネイルを取得しない場合も URL は記録されているので，後でまとめて取得できる
+    if (thumb_url is None) or (not store_monotaro.handle.is_crawl_thumbnail(handle)):
+        return data
+
+    # NOTE: 既に保存済みの画像はダウンロードし直さない
+    if store_monotaro.handle.get_thumb_path(handle, data["item_list"][0]).exists():
+        local_lib.metrics.inc("thumb_cache_hit")
+        return data
+
+    start = time.perf_counter()
+    try:
+        data["png_data"] = store_monotaro.thumbnail.download(thumb_url)
+        data["latency"]["thumb"] = time.perf_counter() - start
+    except:
+        # NOTE: 商品情報は保存し，サムネイルは記録済みの URL から後でまとめて取得する
+        logging.warning("Failed to download thumbnail: {url}".format(url=thumb_url))
+        logging.debug(traceback.format_exc())
+        local_lib.metrics.inc("thumb_error")
+        data["png_data"] = None
+
+    return data
+
+
+def enrich_persist_stage(handle, data):
+    item_list = data["item_list"]
+
+    if data["png_data"] is not None:
+        with open(store_monotaro.handle.get_thumb_path(handle, item_list[0]), "wb") as f:
+            f.write(data["png_data"])
+        store_monotaro.handle.count_thumb(handle)
+
+    # NOTE: キャッシュを書き換えるのはこの段だけにする
+    store_monotaro.handle.set_product_info(handle, item_list, data["product_info"])
+    for kind, sec in data["latency"].items():
+        store_monotaro.handle.update_latency(handle, kind, sec)
+    logging.info(
+        "{name} {category}".format(name=item_list[0]["name"], category=" > ".join(item_list[0]["category"])),
+        extra=local_lib.logger.RATE_LIMIT,
+    )
+
+    store_monotaro.handle.get_progress_bar(handle, STATUS_ENRICH_ITEM).update()
+
+    handle["enrich_count"] = handle.get("enrich_count", 0) + 1
+    if handle["enrich_count"] % ENRICH_STORE_INTERVAL == 0:
+        store_monotaro.handle.store_order_info(handle)
+
+
+def set_pipeline_metrics(report):
+    for name, stat in report["stage"].items():
+        for key in ["utilization", "starve", "block", "depth_max"]:
+            local_lib.metrics.set_gauge("pipeline_{name}_{key}".format(name=name, key=key), stat[key])
+
+
+def enrich_item_list(handle):
+    item_map = store_monotaro.handle.get_enrich_item_map(handle)
+
+    store_monotaro.handle.set_progress_bar(handle, STATUS_ENRICH_ITEM, len(item_map))
+    store_monotaro.handle.set_status(handle, "商品情報を収集しています...")
+
+    logging.info("{count:,} product(s) to fetch detail".format(count=len(item_map)))
+
+    # NOTE: ブラウザは同時に一つの操作しかできないので，ページの取得は一並列で行い，
+    # サムネイルのダウンロードを並列化する
+    report = local_lib.pipeline.run(
+        item_map.values(),
+        [
+            local_lib.pipeline.stage("fetch", lambda item_list: enrich_fetch_stage(handle, item_list)),
+            local_lib.pipeline.stage("parse", enrich_parse_stage),
+            local_lib.pipeline.stage(
+                "download",
+                lambda data: enrich_download_stage(handle, data),
+                store_monotaro.handle.get_download_concurrency(handle),
+            ),
+            local_lib.pipeline.stage("persist", lambda data: enrich_persist_stage(handle, data)),
+        ],
+    )
+    set_pipeline_metrics(report)
+
+    store_monotaro.handle.get_progress_bar(handle, STATUS_ENRICH_ITEM).update()
+    store_monotaro.handle.store_order_info(handle)
+
+
+@local_lib.tracer.span("parse_item")
+@local_lib.driver_telemetry.unit("item")
 def parse_item(handle, item_xpath, col_list):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
@@ -125,12 +410,12 @@ def parse_item(handle, item_xpath, col_list):
     price_text = driver.find_element(
         By.XPATH, item_xpath + "/td[{index}]".format(index=col_list.index("金額(税抜)") + 1)
     ).text
-    price = int(re.match(r".*?(\d{1,3}(?:,\d{3})*)", price_text).group(1).replace(",", ""))
+    price = parse_price(price_text)
 
     tax_text = driver.find_element(
         By.XPATH, item_xpath + "/td[{index}]".format(index=col_list.index("消費税") + 1)
     ).text
-    tax = int(re.match(r"(\d+)", tax_text).group(1)) / 100
+    tax = parse_tax(tax_text)
 
     # NOTE: 税込価格に変換する
     price = round(price * (1 + tax))
@@ -148,15 +433,13 @@ def parse_item(handle, item_xpath, col_list):
         "tax": tax,
         "url": url,
         "id": item_id,
+        "thumb_url": thumb_url,
     }
 
-    save_thumbnail(handle, item, thumb_url)
-
-    fetch_item_detail(handle, item)
-
     return item
 
 
+@local_lib.tracer.span("parse_order")
 def parse_order(handle, order_info):
     ITEM_XPATH = '//table[contains(@class, "oderHistory_product") and contains(@data-ee-list-name, "orderhistory_datail")]/tbody/tr'
 
@@ -180,7 +463,7 @@ def parse_order(handle, order_info):
         By.XPATH, '//div[contains(@id, "oderHistory")]//p[contains(@class, "detail_guide")]'
     ).text.split("\n")[2]
 
-    no = re.match(r"注文書番号：(\d+)", no_text).group(1)
+    no = parse_order_no(no_text)
 
     item_base = {
         "date": date,
@@ -188,114 +471,229 @@ def parse_order(handle, order_info):
         "link_no": order_info["link_no"],
     }
 
+    item_list = []
     for i in range(1, len(driver.find_elements(By.XPATH, ITEM_XPATH))):
         item_xpath = "(" + ITEM_XPATH + ")[{index}]".format(index=i + 1)
 
         if abs(len(driver.find_elements(By.XPATH, item_xpath + "/td")) - len(col_list)) > 1:
             break
 
-        item = parse_item(handle, item_xpath, col_list)
+        item = retry_call(
+            lambda: parse_item(handle, item_xpath, col_list), FETCH_RETRY_COUNT, "parse item {i}".format(i=i)
+        )
         item |= item_base
 
-        if "cancel" not in item:
-            logging.info("{name} {price:,}円".format(name=item["name"], price=item["price"]))
-            store_monotaro.handle.record_item(handle, item)
-        else:
-            logging.info("{name} キャンセルされました".format(name=item["name"]))
+        item_list.append(item)
 
-    return True
+    return item_list
 
 
+def retry_call(func, retry_count, label):
+    for i in range(retry_count + 1):
+        try:
+            return func()
+        except:
+            if i == retry_count:
+                raise
+            logging.warning(
+                "Failed to {label}, retry ({i}/{count})".format(label=label, i=i + 1, count=retry_count)
+            )
+            logging.debug(traceback.format_exc())
+            local_lib.metrics.inc("retry")
+            time.sleep(RETRY_BACKOFF_SEC * (2**i))
+
+
+@local_lib.driver_telemetry.unit("order")
 def fetch_order_item_list_by_order_info(handle, order_info):
+    local_lib.metrics.inc("order")
+
     visit_url(handle, gen_detail_url(order_info))
     keep_logged_on(handle)
 
-    if not parse_order(handle, order_info):
-        logging.warning(
-            "Failed to parse order of {no} ({link_no})".format(
-                no=order_info["no"], link_no=order_info["link_no"]
+    return parse_order(handle, order_info)
+
+
+def record_order_item_list(handle, item_list):
+    for item in item_list:
+        if "cancel" not in item:
+            logging.info(
+                "{name} {price:,}円".format(name=item["name"], price=item["price"]),
+                extra=local_lib.logger.RATE_LIMIT,
+            )
+            store_monotaro.handle.record_item(handle, item)
+            local_lib.metrics.inc("item")
+        else:
+            logging.info(
+                "{name} キャンセルされました".format(name=item["name"]), extra=local_lib.logger.RATE_LIMIT
+            )
+
+
+def gen_order_state(item_list):
+    if len(item_list) == 0:
+        return store_monotaro.handle.ORDER_STATE_EMPTY
+    elif all("cancel" in item for item in item_list):
+        return store_monotaro.handle.ORDER_STATE_CANCELLED
+    else:
+        return store_monotaro.handle.ORDER_STATE_COMPLETE
+
+
+def fetch_order(handle, order_info):
+    # NOTE: 複数回の実行で失敗し続けている注文に時間をかけないよう，再試行は金額の確認のための一回に留める
+    if store_monotaro.handle.is_order_quarantined(handle, order_info["no"]):
+        retry_count = 1
+    else:
+        retry_count = FETCH_RETRY_COUNT
+
+    prev_price = None
+    for i in range(retry_count + 1):
+        start = time.perf_counter()
+        try:
+            item_list = fetch_order_item_list_by_order_info(handle, order_info)
+            store_monotaro.handle.update_latency(handle, "order", time.perf_counter() - start)
+        except LoginError:
+            # NOTE: ログインできない状態では他の注文も取得できないので，全体を中断する
+            raise
+        except:
+            error = traceback.format_exc().strip().split("\n")[-1]
+            logging.warning(
+                "Failed to fetch order {no} ({i}/{count}): {error}".format(
+                    no=order_info["no"], i=i + 1, count=retry_count + 1, error=error
+                )
             )
+            logging.debug(traceback.format_exc())
+            local_lib.metrics.inc("retry")
+            if i != retry_count:
+                time.sleep(RETRY_BACKOFF_SEC * (2**i))
+            continue
+
+        # NOTE: 送料などで一覧の合計と一致しない注文もあるので，二回続けて同じ結果なら受け入れる
+        price = sum(item["price"] for item in item_list if "cancel" not in item)
+        if (price == order_info["total_price"]) or (price == prev_price):
+            record_order_item_list(handle, item_list)
+            store_monotaro.handle.set_order_state(handle, order_info["no"], gen_order_state(item_list))
+            store_monotaro.handle.clear_order_failed(handle, order_info["no"])
+            return True
+
+        error = "Total price mismatch: {price:,} != {total_price:,}".format(
+            price=price, total_price=order_info["total_price"]
         )
-        time.sleep(1)
-        return False
+        logging.warning("{error}, re-fetch order {no}".format(error=error, no=order_info["no"]))
+        local_lib.metrics.inc("order_mismatch")
+        prev_price = price
 
-    return True
+    store_monotaro.handle.set_order_failed(handle, order_info, error)
+    local_lib.metrics.inc("order_error")
+
+    return False
 
 
-def fetch_order_item_list_by_month_impl(handle, month):
-    ORDER_XPATH = '//div[contains(@class, "orderHistory_list_box")]'
+def gen_order_marker(order_info):
+    return "{status}{cancel}".format(
+        status=order_info["status"], cancel=":cancel" if order_info["link_no"] is None else ""
+    )
+
+
+def gen_listing_fingerprint(order_list):
+    return hashlib.sha1(
+        "\n".join(
+            "{no}\t{marker}".format(no=order_info["no"], marker=gen_order_marker(order_info))
+            for order_info in order_list
+        ).encode("utf-8")
+    ).hexdigest()
 
+
+def parse_order_list(handle):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
-    store_monotaro.handle.set_status(
-        handle,
-        "注文履歴を解析しています... {month}".format(month=gen_month_str(month)),
-    )
+    return [
+        {
+            "date": parse_datetime(order_raw["date"]),
+            "total_price": parse_price(order_raw["total_price"]),
+            "no": order_raw["no"],
+            "link_no": order_raw["link_no"],
+            "status": order_raw["status"],
+        }
+        for order_raw in driver.execute_script(ORDER_LIST_SCRIPT)
+    ]
+
+
+def fetch_order_list(handle, month):
+    driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+
+    start = time.perf_counter()
 
     visit_url(handle, gen_hist_url(month))
     keep_logged_on(handle)
 
-    logging.info("Check order of {month}".format(month=gen_month_str(month)))
     logging.info("URL: {url}".format(url=driver.current_url))
 
-    order_list = []
-    for i in range(len(driver.find_elements(By.XPATH, ORDER_XPATH))):
-        order_xpath = "(" + ORDER_XPATH + ")[{index}]".format(index=i + 1)
+    order_list = parse_order_list(handle)
 
-        date_text = driver.find_element(
-            By.XPATH, order_xpath + '//p[contains(@class, "detail_guide")]/strong'
-        ).text
-        date = parse_datetime(date_text)
+    store_monotaro.handle.update_latency(handle, "listing", time.perf_counter() - start)
 
-        total_price_text = driver.find_element(
-            By.XPATH, order_xpath + '//p[contains(@class, "detail_guide")]/span[contains(@class, "price")]'
-        ).text
-        total_price = int(re.match(r".*?(\d{1,3}(?:,\d{3})*)", total_price_text).group(1).replace(",", ""))
+    return order_list
 
-        no = driver.find_element(
-            By.XPATH,
-            order_xpath + '//div[contains(@class, "DeteilItem")]/span[contains(@class, "DeteilItem__Text")]',
-        ).text
 
-        link_no = driver.find_element(
-            By.XPATH,
-            order_xpath + '//div[contains(@class, "OrderStatusArea")]/a[contains(@class, "Button")]',
-        ).get_attribute("data-ee-recv-order-no")
+def fetch_order_item_list_by_month_impl(handle, month, order_list):
+    store_monotaro.handle.set_status(
+        handle,
+        "注文履歴を解析しています... {month}".format(month=gen_month_str(month)),
+    )
 
-        order_list.append(
-            {
-                "date": date,
-                "total_price": total_price,
-                "no": no,
-                "link_no": link_no,
-            }
-        )
+    logging.info("Check order of {month}".format(month=gen_month_str(month)))
+
+    # NOTE: 前回から一覧上の表示が変わっていない注文は，既に処理済みなら確認を省く
+    marker_map = store_monotaro.handle.get_month_listing_marker(handle, month)
+    pending_list = []
 
     for order_info in order_list:
+        if is_budget_exhausted(handle):
+            pending_list.append(order_info["no"])
+            continue
+
+        recycle_browser_if_needed(handle)
+
+        if (marker_map.get(order_info["no"]) == gen_order_marker(order_info)) and (
+            (order_info["link_no"] is None) or store_monotaro.handle.get_order_stat(handle, order_info["no"])
+        ):
+            local_lib.metrics.inc("order_cache_hit")
+            store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL).update()
+            continue
+
         if order_info["link_no"] is None:
             logging.info(
                 "Canceled order: {date} - {no} [cached]".format(
                     date=order_info["date"].strftime("%Y-%m-%d"), no=order_info["no"]
                 )
             )
+            store_monotaro.handle.set_order_state(
+                handle, order_info["no"], store_monotaro.handle.ORDER_STATE_CANCELLED
+            )
             continue
 
         if not store_monotaro.handle.get_order_stat(handle, order_info["no"]):
-            fetch_order_item_list_by_order_info(handle, order_info)
+            local_lib.metrics.inc("order_cache_miss")
+            if not fetch_order(handle, order_info):
+                pending_list.append(order_info["no"])
         else:
+            local_lib.metrics.inc("order_cache_hit")
             logging.info(
-                "Done order: {date} - {no} [cached]".format(
-                    date=order_info["date"].strftime("%Y-%m-%d"), no=order_info["no"]
+                "Done order: {date} - {no} [{state}]".format(
+                    date=order_info["date"].strftime("%Y-%m-%d"),
+                    no=order_info["no"],
+                    state=store_monotaro.handle.get_order_state(handle, order_info["no"]),
                 )
             )
 
         store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL).update()
 
+    return pending_list
 
-def fetch_order_item_list_by_month(handle, month):
-    visit_url(handle, gen_hist_url(month))
 
-    keep_logged_on(handle)
+@local_lib.driver_telemetry.unit("month")
+def fetch_order_item_list_by_month(handle, month, order_list=None):
+    if order_list is None:
+        order_list = fetch_order_list(handle, month)
 
     month_list = store_monotaro.handle.get_month_list(handle)
 
@@ -305,16 +703,35 @@ def fetch_order_item_list_by_month(handle, month):
         )
     )
 
-    fetch_order_item_list_by_month_impl(handle, month)
+    pending_list = fetch_order_item_list_by_month_impl(handle, month, order_list)
 
-    store_monotaro.handle.set_month_checked(handle, month)
-    store_monotaro.handle.store_order_info(handle)
+    if len(pending_list) == 0:
+        store_monotaro.handle.set_month_listing(
+            handle,
+            month,
+            gen_listing_fingerprint(order_list),
+            {order_info["no"]: gen_order_marker(order_info) for order_info in order_list},
+        )
+        store_monotaro.handle.set_month_checked(handle, month)
+    else:
+        # NOTE: 失敗したり時間切れで残ったりした注文を次回に取得できるよう，月としては未確認のままにする
+        store_monotaro.handle.set_month_listing(
+            handle,
+            month,
+            None,
+            {
+                order_info["no"]: gen_order_marker(order_info)
+                for order_info in order_list
+                if order_info["no"] not in pending_list
+            },
+        )
+        store_monotaro.handle.store_order_info(handle)
 
 
 def fetch_month_list(handle):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
-    visit_url(handle, store_monotaro.const.HIST_URL)
+    visit_url(handle, gen_url(store_monotaro.const.HIST_PATH))
 
     keep_logged_on(handle)
 
@@ -338,17 +755,22 @@ def fetch_month_list(handle):
     return month_list
 
 
-def fetch_order_count_by_month(handle, month):
-    driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+def is_month_need_check(handle, month):
+    return (
+        month
+        >= store_monotaro.handle.get_cache_last_modified(handle).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+    ) or (not store_monotaro.handle.get_month_checked(handle, month))
 
+
+def fetch_order_count_by_month(handle, month):
     store_monotaro.handle.set_status(
         handle,
         "注文件数を調べています... {month}年".format(month=gen_month_str(month)),
     )
 
-    visit_url(handle, gen_hist_url(month))
-
-    return len(driver.find_elements(By.XPATH, '//div[contains(@class, "orderHistory_list_box")]'))
+    return fetch_order_list(handle, month)
 
 
 def fetch_order_count(handle):
@@ -358,12 +780,13 @@ def fetch_order_count(handle):
 
     store_monotaro.handle.set_progress_bar(handle, STATUS_MONTH_COUNT, len(month_list))
 
+    # NOTE: 件数を調べる際に読み込んだ注文一覧は，後の解析でそのまま使う
+    order_list_map = {}
     total_count = 0
     for month in month_list:
-        if month >= store_monotaro.handle.get_cache_last_modified(handle).replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0
-        ):
-            count = fetch_order_count_by_month(handle, month)
+        if is_month_need_check(handle, month):
+            order_list_map[month] = fetch_order_count_by_month(handle, month)
+            count = len(order_list_map[month])
             store_monotaro.handle.set_order_count(handle, month, count)
             logging.info("{month}: {count:4,} orders".format(month=gen_month_str(month), count=count))
         else:
@@ -381,60 +804,322 @@ def fetch_order_count(handle):
     store_monotaro.handle.get_progress_bar(handle, STATUS_MONTH_COUNT).update()
     store_monotaro.handle.store_order_info(handle)
 
+    return order_list_map
+
 
 def fetch_order_item_list_all_year(handle):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
-    month_list = fetch_month_list(handle)
+    with local_lib.profiler.phase("month_list"):
+        month_list = fetch_month_list(handle)
 
-    fetch_order_count(handle)
+    with local_lib.profiler.phase("order_count"):
+        order_list_map = fetch_order_count(handle)
 
     store_monotaro.handle.set_progress_bar(
         handle, STATUS_ORDER_ITEM_ALL, store_monotaro.handle.get_total_order_count(handle)
     )
     store_monotaro.handle.set_progress_bar(handle, STATUS_MONTH_ORDER, len(month_list))
 
+    with local_lib.profiler.phase("parse"):
+        for month in month_list:
+            if month not in order_list_map:
+                logging.info("Done order of {month} [cached]".format(month=gen_month_str(month)))
+                store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL).update(
+                    store_monotaro.handle.get_order_count(handle, month)
+                )
+            elif is_month_unchanged(handle, month, order_list_map[month]):
+                logging.info("Done order of {month} [unchanged]".format(month=gen_month_str(month)))
+                local_lib.metrics.inc("month_cache_hit")
+                store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL).update(
+                    store_monotaro.handle.get_order_count(handle, month)
+                )
+            else:
+                local_lib.metrics.inc("month_cache_miss")
+                fetch_order_item_list_by_month(handle, month, order_list_map[month])
+            store_monotaro.handle.get_progress_bar(handle, STATUS_MONTH_ORDER).update()
+
+    store_monotaro.handle.get_progress_bar(handle, STATUS_MONTH_ORDER).update()
+    store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL).update()
+
+
+def is_month_unchanged(handle, month, order_list):
+    # NOTE: 注文一覧が前回と同じなら，注文毎の確認は行わない
+    return store_monotaro.handle.get_month_checked(handle, month) and (
+        gen_listing_fingerprint(order_list) == store_monotaro.handle.get_month_fingerprint(handle, month)
+    )
+
+
+def fetch_order_item_list_newest_first(handle):
+    with local_lib.profiler.phase("month_list"):
+        month_list = fetch_month_list(handle)
+
+    # NOTE: 件数が分かっていない月があるので，一覧を読み込む度に全体の件数を更新する
+    store_monotaro.handle.set_progress_bar(
+        handle,
+        STATUS_ORDER_ITEM_ALL,
+        sum(
+            store_monotaro.handle.get_order_count(handle, month)
+            for month in month_list
+            if store_monotaro.handle.is_order_counted(handle, month)
+        ),
+    )
+    store_monotaro.handle.set_progress_bar(handle, STATUS_MONTH_ORDER, len(month_list))
+    order_bar = store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL)
+
+    with local_lib.profiler.phase("parse"):
+        for month in reversed(month_list):
+            if is_budget_exhausted(handle):
+                logging.info(
+                    "Time budget is exhausted, resume from {month}".format(month=gen_month_str(month))
+                )
+                break
+
+            if not is_month_need_check(handle, month):
+                logging.info("Done order of {month} [cached]".format(month=gen_month_str(month)))
+                order_bar.update(store_monotaro.handle.get_order_count(handle, month))
+            else:
+                order_list = fetch_order_count_by_month(handle, month)
+
+                if store_monotaro.handle.is_order_counted(handle, month):
+                    order_bar.total -= store_monotaro.handle.get_order_count(handle, month)
+                order_bar.total += len(order_list)
+                store_monotaro.handle.set_order_count(handle, month, len(order_list))
+
+                if is_month_unchanged(handle, month, order_list):
+                    logging.info("Done order of {month} [unchanged]".format(month=gen_month_str(month)))
+                    local_lib.metrics.inc("month_cache_hit")
+                    order_bar.update(len(order_list))
+                else:
+                    local_lib.metrics.inc("month_cache_miss")
+                    fetch_order_item_list_by_month(handle, month, order_list)
+
+            store_monotaro.handle.get_progress_bar(handle, STATUS_MONTH_ORDER).update()
+
+    store_monotaro.handle.store_order_info(handle)
+
+    store_monotaro.handle.get_progress_bar(handle, STATUS_MONTH_ORDER).update()
+    order_bar.update()
+
+
+def start_budget(handle):
+    budget_min = store_monotaro.handle.get_crawl_budget(handle)
+    if budget_min is None:
+        return
+
+    logging.info("Time budget is {budget} min".format(budget=budget_min))
+    handle["deadline"] = time.monotonic() + budget_min * 60
+
+
+def is_budget_exhausted(handle):
+    return ("deadline" in handle) and (time.monotonic() > handle["deadline"])
+
+
+def gen_crawl_plan(handle, month_list):
+    done_map = store_monotaro.handle.get_month_done_order_map(handle)
+
+    counted_list = [month for month in month_list if store_monotaro.handle.is_order_counted(handle, month)]
+    if len(counted_list) != 0:
+        order_per_month = sum(
+            store_monotaro.handle.get_order_count(handle, month) for month in counted_list
+        ) / len(counted_list)
+    else:
+        order_per_month = 0
+
+    plan = {"month": [], "listing": 0, "order": 0, "order_estimated": 0}
     for month in month_list:
-        if (
-            month
-            >= store_monotaro.handle.get_cache_last_modified(handle).replace(
-                day=1, hour=0, minute=0, second=0, microsecond=0
-            )
-        ) or (not store_monotaro.handle.get_month_checked(handle, month)):
-            fetch_order_item_list_by_month(handle, month)
+        if not is_month_need_check(handle, month):
+            continue
+
+        plan["listing"] += 1
+
+        if store_monotaro.handle.is_order_counted(handle, month):
+            count = store_monotaro.handle.get_order_count(handle, month)
+            order = max(count - len(done_map.get(month.strftime("%Y-%m"), [])), 0)
+            is_estimated = False
+            plan["order"] += order
         else:
-            logging.info("Done order of {month} [cached]".format(month=gen_month_str(month)))
-            store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL).update(
-                store_monotaro.handle.get_order_count(handle, month)
+            # NOTE: 一度も一覧を見ていない月は，他の月の平均で見積もる
+            order = round(order_per_month)
+            is_estimated = True
+            plan["order_estimated"] += order
+
+        plan["month"].append({"month": month, "order": order, "is_estimated": is_estimated})
+
+    item_map = store_monotaro.handle.get_enrich_item_map(handle)
+    plan["product"] = len(item_map)
+    plan["thumb"] = len(
+        [
+            item_list
+            for item_list in item_map.values()
+            if (item_list[0].get("thumb_url") is not None)
+            and (not store_monotaro.handle.get_thumb_path(handle, item_list[0]).exists())
+        ]
+    )
+
+    # NOTE: 新しい注文に含まれる未知の商品の数は，これまでの注文あたりの商品数で見積もる
+    order_count = len({item["no"] for item in handle["order"]["item_list"]})
+    product_count = len({item["id"] for item in handle["order"]["item_list"]})
+    product_per_order = product_count / order_count if order_count != 0 else 1
+    plan["product_estimated"] = round((plan["order"] + plan["order_estimated"]) * product_per_order)
+
+    order_total = plan["order"] + plan["order_estimated"]
+    product_total = plan["product"] + plan["product_estimated"]
+    if store_monotaro.handle.is_crawl_thumbnail(handle):
+        thumb_total = plan["thumb"] + plan["product_estimated"]
+    else:
+        thumb_total = 0
+
+    plan["latency"] = {
+        kind: {
+            "sec": store_monotaro.handle.get_latency(handle, kind),
+            "is_recorded": store_monotaro.handle.is_latency_recorded(handle, kind),
+        }
+        for kind in store_monotaro.handle.LATENCY_DEFAULT.keys()
+    }
+    plan["duration"] = (
+        plan["listing"] * plan["latency"]["listing"]["sec"]
+        + order_total * plan["latency"]["order"]["sec"]
+        # NOTE: 商品ページの取得とサムネイルのダウンロードは並行して行われる
+        + max(
+            product_total * plan["latency"]["product"]["sec"],
+            thumb_total
+            * plan["latency"]["thumb"]["sec"]
+            / store_monotaro.handle.get_download_concurrency(handle),
+        )
+    )
+
+    return plan
+
+
+def log_crawl_plan(plan):
+    for month_plan in plan["month"]:
+        logging.info(
+            "{month}: listing + {order:4,} order(s){estimated}".format(
+                month=gen_month_str(month_plan["month"]),
+                order=month_plan["order"],
+                estimated=" [estimated]" if month_plan["is_estimated"] else "",
             )
-        store_monotaro.handle.get_progress_bar(handle, STATUS_MONTH_ORDER).update()
+        )
+
+    logging.info("Month listing : {count:6,}".format(count=plan["listing"]))
+    logging.info(
+        "Order detail  : {count:6,} (+{estimated:,} estimated)".format(
+            count=plan["order"], estimated=plan["order_estimated"]
+        )
+    )
+    logging.info(
+        "Product page  : {count:6,} (+{estimated:,} estimated)".format(
+            count=plan["product"], estimated=plan["product_estimated"]
+        )
+    )
+    logging.info(
+        "Thumbnail     : {count:6,} (+{estimated:,} estimated)".format(
+            count=plan["thumb"], estimated=plan["product_estimated"]
+        )
+    )
+    for kind, latency in plan["latency"].items():
+        logging.info(
+            "Latency of {kind:8s}: {sec:5.2f} sec [{source}]".format(
+                kind=kind, sec=latency["sec"], source="recorded" if latency["is_recorded"] else "default"
+            )
+        )
+    logging.info(
+        "Estimated duration: {duration}".format(duration=datetime.timedelta(seconds=round(plan["duration"])))
+    )
+
+
+def plan_crawl(handle):
+    # NOTE: 月の一覧だけを取得し，残りはキャッシュから見積もる
+    store_monotaro.handle.set_status(handle, "収集の計画を立てています...")
+
+    plan = gen_crawl_plan(handle, fetch_month_list(handle))
+    log_crawl_plan(plan)
+
+    store_monotaro.handle.set_status(handle, "収集の計画を立てました．")
+
+    return plan
 
-    store_monotaro.handle.get_progress_bar(handle, STATUS_MONTH_ORDER).update()
-    store_monotaro.handle.get_progress_bar(handle, STATUS_ORDER_ITEM_ALL).update()
+
+def checkpoint_crawl(handle):
+    if not local_lib.memory_tracker.is_enabled():
+        return
+
+    # NOTE: 巡回中は Chrome 側のメモリも増えるので，あわせて記録する．
+    # 巡回中にブラウザを再起動している場合があるので，その時点のドライバを使う．
+    try:
+        driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+        mem_info = local_lib.selenium_util.get_memory_info(driver)
+        extra = {"chrome_mb": mem_info["total"], "chrome_js_heap_mb": mem_info["js_heap"]}
+    except:
+        extra = {}
+
+    local_lib.memory_tracker.checkpoint("crawl", extra)
 
 
 def fetch_order_item_list(handle):
     store_monotaro.handle.set_status(handle, "巡回ロボットの準備をします...")
-    driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+    store_monotaro.handle.get_selenium_driver(handle)
 
     store_monotaro.handle.set_status(handle, "注文履歴の収集を開始します...")
 
+    start_budget(handle)
+
     try:
-        fetch_order_item_list_all_year(handle)
+        if store_monotaro.handle.is_crawl_newest_first(handle):
+            fetch_order_item_list_newest_first(handle)
+        else:
+            fetch_order_item_list_all_year(handle)
+
+        with local_lib.profiler.phase("enrich"):
+            enrich_item_list(handle)
     except:
-        local_lib.selenium_util.dump_page(
-            driver,
-            int(random.random() * 100),
-            store_monotaro.handle.get_debug_dir_path(handle),
-        )
+        handle.pop("deadline", None)
+        dump_page(handle, "fetch_order_item_list")
         raise
 
-    store_monotaro.handle.set_status(handle, "注文履歴の収集が完了しました．")
+    is_timeout = is_budget_exhausted(handle)
+    handle.pop("deadline", None)
+
+    checkpoint_crawl(handle)
+
+    if report_failed_order(handle):
+        pass
+    elif is_timeout:
+        store_monotaro.handle.set_status(handle, "時間切れのため中断しました．次回は続きから収集します．")
+    else:
+        store_monotaro.handle.set_status(handle, "注文履歴の収集が完了しました．")
+
+
+def report_failed_order(handle):
+    failed_list = store_monotaro.handle.get_failed_order_list(handle)
+    if len(failed_list) == 0:
+        return False
+
+    logging.warning("Failed to fetch {count:,} order(s)".format(count=len(failed_list)))
+    for failed in failed_list:
+        logging.warning(
+            "  {date} - {no} ({link_no}): {error} [{count} time(s)]".format(
+                date=failed["date"].strftime("%Y-%m-%d"),
+                no=failed["no"],
+                link_no=failed["link_no"],
+                error=failed["error"],
+                count=failed["count"],
+            )
+        )
+
+    store_monotaro.handle.set_status(
+        handle, "{count:,} 件の注文を収集できませんでした．".format(count=len(failed_list)), is_error=True
+    )
+
+    return True
 
 
 def execute_login(handle):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
+    local_lib.metrics.inc("login")
+
     driver.find_element(By.XPATH, '//input[@name="userId"]').clear()
     driver.find_element(By.XPATH, '//input[@name="userId"]').send_keys(
         store_monotaro.handle.get_login_user(handle)
@@ -452,6 +1137,54 @@ def execute_login(handle):
     time.sleep(2)
 
 
+@local_lib.tracer.span("resolve_captcha")
+def resolve_captcha(handle):
+    driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+
+    engine = store_monotaro.handle.get_captcha_engine(handle)
+    port = store_monotaro.handle.get_captcha_port(handle)
+    if (engine is None) and (port is None):
+        return
+
+    # NOTE: 音声認識などの重いライブラリを読み込むので，必要になった時に import する
+    import local_lib.captcha
+
+    if engine is not None:
+        store_monotaro.handle.set_status(
+            handle, "画像認証を音声認識 ({engine}) で解決します...".format(engine=engine)
+        )
+        try:
+            if local_lib.captcha.resolve_mp3(driver, wait, engine):
+                return
+        except:
+            logging.warning("Failed to resolve captcha by {engine}".format(engine=engine))
+            logging.debug(traceback.format_exc())
+        driver.switch_to.default_content()
+
+    if port is None:
+        return
+
+    if not local_lib.captcha_handoff.is_enabled():
+        local_lib.captcha_handoff.start(port)
+
+    # NOTE: ブラウザが問題を表示したままになるので，回答が届くまで巡回は止まる
+    store_monotaro.handle.set_status(
+        handle, "巡回を止めて画像認証の回答を待っています (http://127.0.0.1:{port}/)...".format(port=port)
+    )
+
+    try:
+        local_lib.captcha.resolve_img_web(driver, wait, store_monotaro.handle.get_captcha_timeout(handle))
+    except concurrent.futures.TimeoutError:
+        # NOTE: 無人で動かしている場合に回答を待ち続けないよう，ログインを諦める
+        logging.error("No answer for captcha")
+        driver.switch_to.default_content()
+        raise LoginError("画像認証の回答が時間内にありませんでした．")
+    except:
+        logging.warning("Failed to resolve captcha")
+        driver.switch_to.default_content()
+
+
+@local_lib.tracer.span("keep_logged_on")
 def keep_logged_on(handle):
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
@@ -465,6 +1198,7 @@ def keep_logged_on(handle):
     for i in range(LOGIN_RETRY_COUNT):
         if i != 0:
             logging.info("Retry to login")
+            local_lib.metrics.inc("retry")
 
         execute_login(handle)
 
@@ -478,39 +1212,61 @@ def keep_logged_on(handle):
 
         logging.warning("Failed to login")
 
-        local_lib.selenium_util.dump_page(
-            driver,
-            int(random.random() * 100),
-            store_monotaro.handle.get_debug_dir_path(handle),
-        )
+        if local_lib.selenium_util.xpath_exists(driver, '//iframe[contains(@title, "reCAPTCHA")]'):
+            local_lib.metrics.inc("captcha")
+            resolve_captcha(handle)
+
+        # NOTE: 書き出しはエラーを処理する fetch_order_item_list でまとめて一度だけ行う
+        record_page(handle)
 
     logging.error("Give up to login")
-    raise Exception("ログインに失敗しました．")
+    raise LoginError("ログインに失敗しました．")
 
 
 if __name__ == "__main__":
     from docopt import docopt
 
-    import local_lib.logger
     import local_lib.config
 
     args = docopt(__doc__)
 
-    local_lib.logger.init("test", level=logging.INFO)
+    local_lib.logger.init(
+        "test", level=logging.INFO, is_queue=True, rate_limit=None if args["-L"] is None else int(args["-L"])
+    )
+
+    if args["-T"] is not None:
+        local_lib.tracer.init(args["-T"])
+    if args["-W"] is not None:
+        local_lib.driver_telemetry.init(args["-W"])
+    if (args["-m"] is not None) or (args["-p"] is not None):
+        local_lib.metrics.init("mohist", args["-m"], None if args["-p"] is None else int(args["-p"]))
+    if args["--profile"] is not None:
+        local_lib.profiler.init(args["--profile"])
 
     config = local_lib.config.load(args["-c"])
+    if args["--newest-first"]:
+        config.setdefault("crawl", {})["newest_first"] = True
+    if args["--budget"] is not None:
+        config.setdefault("crawl", {})["budget"] = float(args["--budget"])
+    if args["--no-thumb"]:
+        config.setdefault("crawl", {})["thumbnail"] = False
     handle = store_monotaro.handle.create(config)
 
     driver, wait = store_monotaro.handle.get_selenium_driver(handle)
 
     try:
-        fetch_order_item_list(handle)
+        if args["--plan"]:
+            plan_crawl(handle)
+        else:
+            with local_lib.profiler.phase("fetch"):
+                fetch_order_item_list(handle)
     except:
-        driver, wait = store_monotaro.handle.get_selenium_driver(handle)
+        # NOTE: 直近のページは fetch_order_item_list で書き出し済み
         logging.error(traceback.format_exc())
 
-        local_lib.selenium_util.dump_page(
-            driver,
-            int(random.random() * 100),
-            store_monotaro.handle.get_debug_dir_path(handle),
-        )
+    local_lib.tracer.finish()
+    local_lib.driver_telemetry.finish()
+    local_lib.metrics.finish()
+    local_lib.profiler.finish()
+
+    local_lib.logger.finish()
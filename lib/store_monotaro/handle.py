@@ -1,27 +1,48 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import copy
+import logging
 import pathlib
 import enlighten
 import datetime
 import functools
 
-from selenium.webdriver.support.wait import WebDriverWait
 import openpyxl.styles
 
+import local_lib.driver_telemetry
+import local_lib.memory_tracker
+import local_lib.metrics
 import local_lib.serializer
-import local_lib.selenium_util
+import local_lib.tracer
+import store_monotaro.const
+
+ORDER_STATE_COMPLETE = "complete"
+ORDER_STATE_CANCELLED = "cancelled"
+ORDER_STATE_EMPTY = "empty"
+ORDER_STATE_FAILED = "failed"
+
+# NOTE: これらの状態の注文は，以降の実行で内容を確認し直す必要がない
+ORDER_STATE_TERMINAL = [ORDER_STATE_COMPLETE, ORDER_STATE_CANCELLED, ORDER_STATE_EMPTY]
+
+ORDER_QUARANTINE_COUNT = 2
+
+# NOTE: 所要時間の実績が無い場合に見積もりに使う値 (秒)
+LATENCY_DEFAULT = {"listing": 3.0, "order": 5.0, "product": 3.0, "thumb": 0.5}
+LATENCY_EWMA_ALPHA = 0.2
 
 AGENT_NAME = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
 
 
-def create(config):
+def create(config, is_progress=True):
     handle = {
-        "progress_manager": enlighten.get_manager(),
+        # NOTE: 並列に収集するワーカープロセスでは進捗表示を行わない
+        "progress_manager": enlighten.get_manager(enabled=is_progress),
         "progress_bar": {},
         "config": config,
     }
 
     load_order_info(handle)
+    local_lib.memory_tracker.checkpoint("load_order_info")
 
     prepare_directory(handle)
 
@@ -36,6 +57,76 @@ def get_login_pass(handle):
     return handle["config"]["login"]["monotaro"]["pass"]
 
 
+def is_multi_account(config):
+    return isinstance(config["login"]["monotaro"], list)
+
+
+def get_account_list(config):
+    if is_multi_account(config):
+        return config["login"]["monotaro"]
+    else:
+        return [config["login"]["monotaro"]]
+
+
+def get_account_name(account):
+    return account.get("name", account["user"])
+
+
+def get_concurrency(config):
+    return config.get("crawl", {}).get("concurrency", 1)
+
+
+def is_crawl_newest_first(handle):
+    return handle["config"].get("crawl", {}).get("newest_first", False)
+
+
+def get_crawl_budget(handle):
+    return handle["config"].get("crawl", {}).get("budget")
+
+
+def is_crawl_thumbnail(handle):
+    return handle["config"].get("crawl", {}).get("thumbnail", True)
+
+
+def get_download_concurrency(handle):
+    return handle["config"].get("crawl", {}).get("download_concurrency", 4)
+
+
+def gen_account_config(config, account):
+    # NOTE: アカウント毎に，キャッシュ，サムネイル，ブラウザのプロファイルのフォルダを分ける
+    name = get_account_name(account)
+
+    account_config = copy.deepcopy(config)
+    account_config["login"]["monotaro"] = account
+
+    data_config = account_config["data"]
+    data_config["selenium"] = str(pathlib.Path(data_config["selenium"], name))
+    data_config["debug"] = str(pathlib.Path(data_config["debug"], name))
+
+    cache_config = data_config["monotaro"]["cache"]
+    order_path = pathlib.Path(cache_config["order"])
+    cache_config["order"] = str(order_path.parent / name / order_path.name)
+    cache_config["thumb"] = str(pathlib.Path(cache_config["thumb"], name))
+
+    return account_config
+
+
+def merge_account_order_info(handle):
+    item_list = []
+    handle["account_thumb_dir"] = {}
+
+    for account in get_account_list(handle["config"]):
+        name = get_account_name(account)
+        account_handle = {"config": gen_account_config(handle["config"], account)}
+
+        load_order_info(account_handle)
+
+        handle["account_thumb_dir"][name] = get_thumb_dir_path(account_handle)
+        item_list.extend(item | {"account": name} for item in account_handle["order"]["item_list"])
+
+    handle["order"]["item_list"] = item_list
+
+
 def prepare_directory(handle):
     get_selenium_data_dir_path(handle).mkdir(parents=True, exist_ok=True)
     get_debug_dir_path(handle).mkdir(parents=True, exist_ok=True)
@@ -44,6 +135,38 @@ def prepare_directory(handle):
     get_excel_file_path(handle).parent.mkdir(parents=True, exist_ok=True)
 
 
+def get_captcha_port(handle):
+    return handle["config"].get("captcha", {}).get("port")
+
+
+def get_captcha_engine(handle):
+    return handle["config"].get("captcha", {}).get("engine")
+
+
+def get_captcha_timeout(handle):
+    return handle["config"].get("captcha", {}).get("timeout", 300)
+
+
+def gen_url(path):
+    return store_monotaro.const.BASE_URL + path
+
+
+def gen_hist_url(date):
+    return gen_url(store_monotaro.const.HIST_PATH_BY_MONTH.format(year=date.year, month=date.month))
+
+
+def gen_detail_url(order_info):
+    return gen_url(store_monotaro.const.DETAIL_PATH_BY_LINK_NO.format(link_no=order_info["link_no"]))
+
+
+def get_browser_memory_limit(handle):
+    return handle["config"].get("browser", {}).get("memory_limit")
+
+
+def get_browser_check_interval(handle):
+    return handle["config"].get("browser", {}).get("check_interval", 100)
+
+
 def get_excel_font(handle):
     font_config = handle["config"]["output"]["excel"]["font"]
     return openpyxl.styles.Font(name=font_config["name"], size=font_config["size"])
@@ -73,8 +196,13 @@ def get_selenium_driver(handle):
     if "selenium" in handle:
         return (handle["selenium"]["driver"], handle["selenium"]["wait"])
     else:
-        driver = local_lib.selenium_util.create_driver(
-            "Mohist", get_selenium_data_dir_path(handle), AGENT_NAME
+        # NOTE: Excel の出力のみの場合に Selenium を読み込まなくて済むよう，ここで import する
+        from selenium.webdriver.support.wait import WebDriverWait
+
+        import local_lib.selenium_util
+
+        driver = local_lib.driver_telemetry.wrap(
+            local_lib.selenium_util.create_driver("Mohist", get_selenium_data_dir_path(handle), AGENT_NAME)
         )
         wait = WebDriverWait(driver, 5)
 
@@ -88,19 +216,137 @@ def get_selenium_driver(handle):
         return (driver, wait)
 
 
+def get_worker_tab(handle):
+    import local_lib.selenium_util
+
+    driver, wait = get_selenium_driver(handle)
+
+    # NOTE: 商品ページの参照用に，閉じずに使い回すタブを用意しておく
+    if handle["selenium"].get("worker_tab") not in driver.window_handles:
+        handle["selenium"]["worker_tab"] = local_lib.selenium_util.open_worker_tab(driver)
+
+    return local_lib.selenium_util.worker_tab(driver, handle["selenium"]["worker_tab"])
+
+
+def recycle_selenium_driver(handle):
+    # NOTE: ログイン状態を保つため，Cookie を引き継いでブラウザを起動し直す
+    driver, wait = get_selenium_driver(handle)
+    cookie_list = driver.get_cookies()
+
+    quit_selenium_driver(handle)
+
+    driver, wait = get_selenium_driver(handle)
+    driver.get(gen_url("/"))
+    for cookie in cookie_list:
+        if "expiry" in cookie:
+            cookie["expiry"] = int(cookie["expiry"])
+        try:
+            driver.add_cookie(cookie)
+        except:
+            logging.debug("Failed to restore cookie: {name}".format(name=cookie["name"]))
+
+    return (driver, wait)
+
+
 def record_item(handle, item):
+    # NOTE: 商品ページを参照済みの商品は，その情報をそのまま使う
+    if item["id"] in handle["order"]["product"]:
+        item |= handle["order"]["product"][item["id"]]
+        local_lib.metrics.inc("product_cache_hit")
+
     handle["order"]["item_list"].append(item)
     handle["order"]["order_no_stat"][item["no"]] = True
 
 
+def set_order_state(handle, no, state):
+    handle["order"]["order_state"][no] = {"state": state, "time": datetime.datetime.now()}
+
+
+def get_order_state(handle, no):
+    if no in handle["order"]["order_state"]:
+        return handle["order"]["order_state"][no]["state"]
+    elif no in handle["order"]["order_no_stat"]:
+        # NOTE: 状態を記録する前のキャッシュとの互換性のため
+        return ORDER_STATE_COMPLETE
+    else:
+        return None
+
+
 def get_order_stat(handle, no):
-    return no in handle["order"]["order_no_stat"]
+    return get_order_state(handle, no) in ORDER_STATE_TERMINAL
+
+
+def get_enrich_item_map(handle):
+    # NOTE: 商品ページを未参照の購入品を，商品 ID 毎にまとめて返す
+    item_map = {}
+    for item in handle["order"]["item_list"]:
+        if "category" not in item:
+            item_map.setdefault(item["id"], []).append(item)
+
+    return item_map
+
+
+def count_thumb(handle):
+    # NOTE: 保存したサムネイル画像の数．変化の有無を調べるためにファイルを走査しなくて済むようにする
+    handle["thumb_count"] = handle.get("thumb_count", 0) + 1
+
+
+def get_thumb_count(handle):
+    return handle.get("thumb_count", 0)
+
+
+def set_product_info(handle, item_list, product_info):
+    handle["order"]["product"][item_list[0]["id"]] = product_info
+
+    for item in item_list:
+        item |= product_info
+
+
+def set_order_failed(handle, order_info, error):
+    failed = handle["order"]["order_failed"].get(order_info["no"], {"count": 0})
+
+    set_order_state(handle, order_info["no"], ORDER_STATE_FAILED)
+    handle["order"]["order_failed"][order_info["no"]] = {
+        "no": order_info["no"],
+        "link_no": order_info["link_no"],
+        "date": order_info["date"],
+        "error": error,
+        "count": failed["count"] + 1,
+        "time": datetime.datetime.now(),
+    }
+
+
+def clear_order_failed(handle, no):
+    handle["order"]["order_failed"].pop(no, None)
+
+
+def is_order_quarantined(handle, no):
+    # NOTE: 一度の失敗では隔離せず，複数回の実行で失敗し続けている注文のみを対象にする
+    return handle["order"]["order_failed"].get(no, {"count": 0})["count"] >= ORDER_QUARANTINE_COUNT
+
+
+def get_failed_order_list(handle):
+    return sorted(handle["order"]["order_failed"].values(), key=lambda x: x["date"])
 
 
 def get_item_list(handle):
     return sorted(handle["order"]["item_list"], key=lambda x: x["date"])
 
 
+def get_month_done_order_map(handle):
+    # NOTE: 月毎に，内容の確認が済んでいる注文の番号をまとめる
+    done_map = {}
+    for item in handle["order"]["item_list"]:
+        done_map.setdefault(item["date"].strftime("%Y-%m"), set()).add(item["no"])
+
+    for month_str, listing in handle["order"]["month_listing"].items():
+        for no, marker in listing["marker"].items():
+            if get_order_stat(handle, no) or marker.endswith(":cancel"):
+                done_map.setdefault(month_str, set()).add(no)
+
+    return done_map
+
+
 def set_month_list(handle, month_list):
     handle["order"]["month_list"] = month_list
 
@@ -117,6 +363,10 @@ def get_order_count(handle, month):
     return handle["order"]["month_count"][month.strftime("%Y-%m")]
 
 
+def is_order_counted(handle, month):
+    return month.strftime("%Y-%m") in handle["order"]["month_count"]
+
+
 def get_total_order_count(handle):
     return functools.reduce(lambda a, b: a + b, handle["order"]["month_count"].values())
 
@@ -130,8 +380,43 @@ def get_month_checked(handle, month):
     return month.strftime("%Y-%m") in handle["order"]["month_stat"]
 
 
+def set_month_listing(handle, month, fingerprint, marker_map):
+    handle["order"]["month_listing"][month.strftime("%Y-%m")] = {
+        "fingerprint": fingerprint,
+        "marker": marker_map,
+    }
+
+
+def get_month_fingerprint(handle, month):
+    return handle["order"]["month_listing"].get(month.strftime("%Y-%m"), {}).get("fingerprint")
+
+
+def get_month_listing_marker(handle, month):
+    return handle["order"]["month_listing"].get(month.strftime("%Y-%m"), {}).get("marker", {})
+
+
+def update_latency(handle, kind, sec):
+    latency_map = handle["order"]["latency"]
+
+    if kind in latency_map:
+        latency_map[kind] += LATENCY_EWMA_ALPHA * (sec - latency_map[kind])
+    else:
+        latency_map[kind] = sec
+
+
+def get_latency(handle, kind):
+    return handle["order"]["latency"].get(kind, LATENCY_DEFAULT[kind])
+
+
+def is_latency_recorded(handle, kind):
+    return kind in handle["order"]["latency"]
+
+
 def get_thumb_path(handle, item):
-    return get_thumb_dir_path(handle) / (item["id"] + ".png")
+    if "account" in item:
+        return handle["account_thumb_dir"][item["account"]] / (item["id"] + ".png")
+    else:
+        return get_thumb_dir_path(handle) / (item["id"] + ".png")
 
 
 def get_cache_last_modified(handle):
@@ -147,6 +432,10 @@ def set_progress_bar(handle, desc, total):
         "{desc:30s}{desc_pad}{count:5d} {unit}{unit_pad}[{elapsed}, {rate:6.2f}{unit_pad}{unit}/s]{fill}"
     )
 
+    # NOTE: 常駐して繰り返し実行する場合に，前回のものが残らないようにする
+    if desc in handle["progress_bar"]:
+        handle["progress_bar"][desc].close()
+
     handle["progress_bar"][desc] = handle["progress_manager"].counter(
         total=total, desc=desc, bar_format=BAR_FORMAT, counter_format=COUNTER_FORMAT
     )
@@ -170,20 +459,28 @@ def set_status(handle, status, is_error=False):
         handle["status"].update(status=status, force=True)
 
 
-def finish(handle):
+def quit_selenium_driver(handle):
     if "selenium" in handle:
-        handle["selenium"]["driver"].quit()
-        handle.pop("selenium")
+        try:
+            handle["selenium"]["driver"].quit()
+        finally:
+            handle.pop("selenium")
+
+
+def finish(handle):
+    quit_selenium_driver(handle)
 
     handle["progress_manager"].stop()
 
 
+@local_lib.tracer.span("store_order_info")
 def store_order_info(handle):
     handle["order"]["last_modified"] = datetime.datetime.now()
 
     local_lib.serializer.store(get_caceh_file_path(handle), handle["order"])
 
 
+@local_lib.tracer.span("load_order_info")
 def load_order_info(handle):
     handle["order"] = local_lib.serializer.load(
         get_caceh_file_path(handle),
@@ -191,8 +488,13 @@ def load_order_info(handle):
             "month_list": [],
             "month_count": {},
             "month_stat": {},
+            "month_listing": {},
             "item_list": [],
+            "product": {},
             "order_no_stat": {},
+            "order_state": {},
+            "order_failed": {},
+            "latency": {},
             "last_modified": datetime.datetime(1994, 7, 5),
         },
     )
@@ -4,14 +4,17 @@
 モノタロウの購入履歴情報をエクセルファイルに書き出します．
 
 Usage:
-  order_history.py [-c CONFIG] [-o EXCEL] [-N]
+  order_history.py [-c CONFIG] [-o EXCEL] [-N] [-T TRACE] [--profile PROFILE_DIR]
 
 Options:
   -c CONFIG     : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
   -o EXCEL      : 生成する Excel ファイルを指定します．[default: amazhist.xlsx]
   -N            : サムネイル画像を含めないようにします．
+  -T TRACE      : 処理のフェーズ毎の所要時間を TRACE に書き出します．
+  --profile PROFILE_DIR : サンプリングプロファイラを有効にし，結果を PROFILE_DIR に書き出します．
 """
 
+import copy
 import logging
 
 import openpyxl
@@ -21,9 +24,11 @@ import openpyxl.drawing.image
 import openpyxl.drawing.xdr
 import openpyxl.drawing.spreadsheet_drawing
 
+import local_lib.memory_tracker
 import local_lib.openpyxl_util
+import local_lib.profiler
+import local_lib.tracer
 import store_monotaro.handle
-import store_monotaro.crawler
 
 STATUS_INSERT_ITEM = "[generate] Insert item"
 STATUS_ALL = "[generate] Excel file"
@@ -96,13 +101,34 @@ SHEET_DEF = {
                 "width": 28,
                 "format": "@",
                 "wrap": True,
-                "link_func": lambda item: store_monotaro.crawler.gen_detail_url(item),
+                "link_func": lambda item: store_monotaro.handle.gen_detail_url(item),
             },
         },
     },
 }
 
 
+ACCOUNT_COL_DEF = {
+    "label": "アカウント",
+    "pos": 13,
+    "width": 20,
+    "format": "@",
+    "optional": True,
+}
+
+
+def get_sheet_def(handle):
+    if not store_monotaro.handle.is_multi_account(handle["config"]):
+        return SHEET_DEF
+
+    # NOTE: 複数アカウントの結果をまとめる場合は，アカウントの列を追加する
+    sheet_def = copy.deepcopy(SHEET_DEF)
+    sheet_def["TABLE_HEADER"]["col"]["account"] = ACCOUNT_COL_DEF
+
+    return sheet_def
+
+
+@local_lib.tracer.span("generate_sheet")
 def generate_sheet(handle, book, is_need_thumb=True):
     item_list = store_monotaro.handle.get_item_list(handle)
 
@@ -111,7 +137,7 @@ def generate_sheet(handle, book, is_need_thumb=True):
     local_lib.openpyxl_util.generate_list_sheet(
         book,
         item_list,
-        SHEET_DEF,
+        get_sheet_def(handle),
         is_need_thumb,
         lambda item: store_monotaro.handle.get_thumb_path(handle, item),
         lambda status: store_monotaro.handle.set_status(handle, status),
@@ -120,6 +146,7 @@ def generate_sheet(handle, book, is_need_thumb=True):
     )
 
 
+@local_lib.tracer.span("generate_table_excel")
 def generate_table_excel(handle, excel_file, is_need_thumb=True):
     store_monotaro.handle.set_status(handle, "エクセルファイルの作成を開始します...")
     store_monotaro.handle.set_progress_bar(handle, STATUS_ALL, 5)
@@ -131,13 +158,17 @@ def generate_table_excel(handle, excel_file, is_need_thumb=True):
 
     store_monotaro.handle.get_progress_bar(handle, STATUS_ALL).update()
 
-    generate_sheet(handle, book, is_need_thumb)
+    with local_lib.profiler.phase("generate_sheet"):
+        generate_sheet(handle, book, is_need_thumb)
+    local_lib.memory_tracker.checkpoint("generate_sheet")
 
     book.remove(book.worksheets[0])
 
     store_monotaro.handle.set_status(handle, "エクセルファイルを書き出しています...")
 
-    book.save(excel_file)
+    with local_lib.tracer.span("save_excel"), local_lib.profiler.phase("save"):
+        book.save(excel_file)
+    local_lib.memory_tracker.checkpoint("save_excel")
 
     store_monotaro.handle.get_progress_bar(handle, STATUS_ALL).update()
 
@@ -164,8 +195,17 @@ if __name__ == "__main__":
     excel_file = args["-o"]
     is_need_thumb = not args["-N"]
 
+    if args["-T"] is not None:
+        local_lib.tracer.init(args["-T"])
+    if args["--profile"] is not None:
+        local_lib.profiler.init(args["--profile"])
+
     handle = store_monotaro.handle.create(config)
 
-    generate_table_excel(handle, excel_file, is_need_thumb)
+    with local_lib.profiler.phase("excel"):
+        generate_table_excel(handle, excel_file, is_need_thumb)
 
     store_monotaro.handle.finish(handle)
+
+    local_lib.tracer.finish()
+    local_lib.profiler.finish()
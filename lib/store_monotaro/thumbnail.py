@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+購入履歴に記録したサムネイル画像の URL から，まだ保存していない画像をまとめてダウンロードします．
+同じ商品の画像は一度だけダウンロードします．
+
+Usage:
+  thumbnail.py [-c CONFIG] [-n CONCURRENCY]
+
+Options:
+  -c CONFIG         : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
+  -n CONCURRENCY    : 同時にダウンロードする数．指定しない場合は設定ファイルの値を使います．
+"""
+
+import io
+import logging
+import traceback
+import urllib.request
+
+import PIL.Image
+
+import local_lib.metrics
+import local_lib.pipeline
+import local_lib.tracer
+import store_monotaro.handle
+
+STATUS_BACKFILL = "[backfill] Thumbnail"
+
+TIMEOUT_SEC = 30
+
+
+@local_lib.tracer.span("download_thumbnail")
+def download(thumb_url):
+    req = urllib.request.Request(thumb_url, headers={"User-Agent": store_monotaro.handle.AGENT_NAME})
+    with urllib.request.urlopen(req, timeout=TIMEOUT_SEC) as res:
+        img_data = res.read()
+
+    local_lib.metrics.inc("thumb_cache_miss")
+    local_lib.metrics.inc("download_bytes", len(img_data))
+
+    # NOTE: サムネイルは PNG で保存する
+    with PIL.Image.open(io.BytesIO(img_data)) as img:
+        png_buf = io.BytesIO()
+        img.save(png_buf, "PNG")
+
+    return png_buf.getvalue()
+
+
+def get_backfill_item_list(handle):
+    # NOTE: 商品 ID 毎に一つずつ，画像が保存されていないものを返す
+    item_map = {}
+    checked_id = set()
+    for item in handle["order"]["item_list"]:
+        if (item["id"] in checked_id) or (item.get("thumb_url") is None):
+            continue
+        checked_id.add(item["id"])
+
+        if store_monotaro.handle.get_thumb_path(handle, item).exists():
+            local_lib.metrics.inc("thumb_cache_hit")
+            continue
+        item_map[item["id"]] = item
+
+    return list(item_map.values())
+
+
+def download_stage(item):
+    try:
+        return {"item": item, "png_data": download(item["thumb_url"])}
+    except:
+        logging.warning("Failed to download thumbnail: {url}".format(url=item["thumb_url"]))
+        logging.debug(traceback.format_exc())
+        local_lib.metrics.inc("thumb_error")
+        return None
+
+
+def save_stage(handle, data):
+    with open(store_monotaro.handle.get_thumb_path(handle, data["item"]), "wb") as f:
+        f.write(data["png_data"])
+    store_monotaro.handle.count_thumb(handle)
+
+    store_monotaro.handle.get_progress_bar(handle, STATUS_BACKFILL).update()
+
+
+def backfill(handle, concurrency=None):
+    if concurrency is None:
+        concurrency = store_monotaro.handle.get_download_concurrency(handle)
+
+    item_list = get_backfill_item_list(handle)
+
+    logging.info("{count:,} thumbnail(s) to download".format(count=len(item_list)))
+
+    store_monotaro.handle.set_progress_bar(handle, STATUS_BACKFILL, len(item_list))
+    store_monotaro.handle.set_status(handle, "サムネイル画像をダウンロードしています...")
+
+    local_lib.pipeline.run(
+        item_list,
+        [
+            local_lib.pipeline.stage("download", download_stage, concurrency),
+            local_lib.pipeline.stage("save", lambda data: save_stage(handle, data)),
+        ],
+    )
+
+    store_monotaro.handle.get_progress_bar(handle, STATUS_BACKFILL).update()
+    store_monotaro.handle.set_status(handle, "サムネイル画像のダウンロードが完了しました．")
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    import local_lib.logger
+    import local_lib.config
+
+    args = docopt(__doc__)
+
+    local_lib.logger.init("mohist", level=logging.INFO)
+
+    config = local_lib.config.load(args["-c"])
+    concurrency = None if args["-n"] is None else int(args["-n"])
+
+    # NOTE: 複数アカウントの場合は，アカウント毎のフォルダに保存する
+    for account in store_monotaro.handle.get_account_list(config):
+        if store_monotaro.handle.is_multi_account(config):
+            account_config = store_monotaro.handle.gen_account_config(config, account)
+        else:
+            account_config = config
+
+        handle = store_monotaro.handle.create(account_config)
+        try:
+            backfill(handle, concurrency)
+        finally:
+            store_monotaro.handle.finish(handle)